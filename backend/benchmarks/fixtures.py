@@ -0,0 +1,178 @@
+import os
+import json
+import zipfile
+import numpy as np
+import shapely
+from pyogrio.raw import write
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyproj import CRS, Transformer
+
+# Dữ liệu giả lập cho benchmark import: điểm, đường và polygon phức tạp (nhiều đỉnh, có lỗ)
+# rải trong khung Việt Nam. Các định dạng trừ KMZ được ghi ở UTM 48N để đo cả bước chuyển
+# hệ toạ độ; KML luôn là WGS84 nên KMZ không cần chuyển.
+SIZES = {'1k': 1000, '100k': 100000, '1m': 1000000}
+GEOMETRY_KINDS = ('point', 'line', 'polygon')
+FORMATS = ('geojson', 'kmz', 'gpkg', 'zip', 'fgb', 'parquet')
+SOURCE_CRS = 'EPSG:32648'
+BBOX = (102.0, 8.5, 109.5, 23.4)
+LINE_VERTICES = 20
+POLYGON_VERTICES = 200
+# Số feature sinh ra và ghi mỗi lần, để file 1M feature không phải nằm hết trong bộ nhớ
+CHUNK_SIZE = 50000
+
+FIXTURE_DIR = os.getenv("BENCHMARK_FIXTURE_DIR", os.path.join(os.path.dirname(__file__), "fixtures"))
+
+def random_centers(rng, count):
+    return np.column_stack([rng.uniform(BBOX[0], BBOX[2], count), rng.uniform(BBOX[1], BBOX[3], count)])
+
+def make_points(rng, count):
+    return shapely.points(random_centers(rng, count))
+
+def make_lines(rng, count):
+    steps = rng.normal(0, 0.002, (count, LINE_VERTICES, 2))
+    coords = random_centers(rng, count)[:, None, :] + np.cumsum(steps, axis=1)
+    return shapely.linestrings(coords)
+
+def make_polygons(rng, count):
+    # Đa giác hình sao nhiều đỉnh với một lỗ ở giữa
+    angles = np.linspace(0, 2 * np.pi, POLYGON_VERTICES, endpoint=False)
+    radius = 0.01 * (1 + 0.3 * rng.random((count, POLYGON_VERTICES)))
+    centers = random_centers(rng, count)
+    shell = centers[:, None, :] + radius[..., None] * np.stack([np.cos(angles), np.sin(angles)], axis=-1)
+    shell = np.concatenate([shell, shell[:, :1]], axis=1)
+    hole_angles = np.linspace(2 * np.pi, 0, 9)
+    hole = centers[:, None, :] + 0.003 * np.stack([np.cos(hole_angles), np.sin(hole_angles)], axis=-1)
+    holes = shapely.linearrings(hole)
+    return shapely.polygons(shapely.linearrings(shell), holes=holes[:, None])
+
+GENERATORS = {'point': make_points, 'line': make_lines, 'polygon': make_polygons}
+
+def make_chunks(kind, size, seed=0):
+    rng = np.random.default_rng(seed)
+    for start in range(0, size, CHUNK_SIZE):
+        count = min(CHUNK_SIZE, size - start)
+        index = np.arange(start, start + count)
+        fields = {
+            'VARNAME_1': np.array([f"{kind}_{i}" for i in index], dtype=object),
+            'value': rng.random(count),
+            'count': rng.integers(0, 1000, count),
+            'category': np.array(['a', 'b', 'c', 'd'], dtype=object)[index % 4],
+        }
+        yield GENERATORS[kind](rng, count), fields
+
+def to_source_crs(geometries):
+    transformer = Transformer.from_crs('EPSG:4326', SOURCE_CRS, always_xy=True)
+    return shapely.transform(geometries, transformer.transform, interleaved=False)
+
+def write_geojson(path, chunks):
+    with open(path, 'w') as out:
+        out.write('{"type": "FeatureCollection", "crs": {"type": "name", "properties": {"name": "urn:ogc:def:crs:EPSG::32648"}}, "features": [\n')
+        first = True
+        for geometries, fields in chunks:
+            geojson = shapely.to_geojson(to_source_crs(geometries))
+            for i, geometry in enumerate(geojson):
+                properties = json.dumps({key: values[i].item() if hasattr(values[i], 'item') else values[i] for key, values in fields.items()})
+                out.write(('' if first else ',\n') + '{"type": "Feature", "properties": ' + properties + ', "geometry": ' + geometry + '}')
+                first = False
+        out.write('\n]}\n')
+
+def kml_coordinates(geometry):
+    return ' '.join(f"{x:.7f},{y:.7f}" for x, y in shapely.get_coordinates(geometry))
+
+def kml_geometry(geometry):
+    if geometry.geom_type == 'Point':
+        return f"<Point><coordinates>{kml_coordinates(geometry)}</coordinates></Point>"
+    if geometry.geom_type == 'LineString':
+        return f"<LineString><coordinates>{kml_coordinates(geometry)}</coordinates></LineString>"
+    inner = ''.join(
+        f"<innerBoundaryIs><LinearRing><coordinates>{kml_coordinates(ring)}</coordinates></LinearRing></innerBoundaryIs>"
+        for ring in geometry.interiors
+    )
+    return f"<Polygon><outerBoundaryIs><LinearRing><coordinates>{kml_coordinates(geometry.exterior)}</coordinates></LinearRing></outerBoundaryIs>{inner}</Polygon>"
+
+def write_kmz(path, chunks):
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        with archive.open('doc.kml', 'w', force_zip64=True) as out:
+            out.write(b'<?xml version="1.0" encoding="UTF-8"?>\n<kml xmlns="http://www.opengis.net/kml/2.2"><Document>\n')
+            for geometries, fields in chunks:
+                for i, geometry in enumerate(geometries):
+                    out.write(f"<Placemark><name>{fields['VARNAME_1'][i]}</name>{kml_geometry(geometry)}</Placemark>\n".encode())
+            out.write(b'</Document></kml>\n')
+
+def write_ogr(path, chunks, driver):
+    for index, (geometries, fields) in enumerate(chunks):
+        write(
+            path,
+            shapely.to_wkb(to_source_crs(geometries)),
+            list(fields.values()),
+            list(fields.keys()),
+            driver=driver,
+            geometry_type=geometries[0].geom_type,
+            crs=SOURCE_CRS,
+            append=index > 0,
+        )
+
+def write_shapefile_zip(path, chunks):
+    base = path[:-len('.zip')]
+    write_ogr(base + '.shp', chunks, 'ESRI Shapefile')
+    with zipfile.ZipFile(path, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for suffix in ('.shp', '.shx', '.dbf', '.prj', '.cpg'):
+            if os.path.exists(base + suffix):
+                archive.write(base + suffix, os.path.basename(base) + suffix)
+                os.remove(base + suffix)
+
+def geoarrow_array(geometries):
+    # Mã hoá GeoArrow gốc (toạ độ struct<x, y> + các mảng offset) cho GeoParquet
+    _, coords, offsets = shapely.to_ragged_array(geometries)
+    array = pa.StructArray.from_arrays([pa.array(coords[:, 0]), pa.array(coords[:, 1])], names=['x', 'y'])
+    for value_offsets in offsets:
+        array = pa.ListArray.from_arrays(pa.array(value_offsets.astype('int32')), array)
+    return array
+
+def write_geoparquet(path, chunks):
+    writer = None
+    try:
+        for geometries, fields in chunks:
+            columns = {key: pa.array(values) for key, values in fields.items()}
+            columns['geometry'] = geoarrow_array(to_source_crs(geometries))
+            table = pa.table(columns)
+            if writer is None:
+                geo = {
+                    'version': '1.1.0',
+                    'primary_column': 'geometry',
+                    'columns': {'geometry': {
+                        'encoding': geometries[0].geom_type.lower(),
+                        'geometry_types': [geometries[0].geom_type],
+                        'crs': CRS(SOURCE_CRS).to_json_dict(),
+                    }},
+                }
+                table = table.replace_schema_metadata({b'geo': json.dumps(geo).encode()})
+                writer = pq.ParquetWriter(path, table.schema)
+            writer.write_table(table.cast(writer.schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+WRITERS = {
+    'geojson': write_geojson,
+    'kmz': write_kmz,
+    'gpkg': lambda path, chunks: write_ogr(path, chunks, 'GPKG'),
+    'zip': write_shapefile_zip,
+    'fgb': lambda path, chunks: write_ogr(path, chunks, 'FlatGeobuf'),
+    'parquet': write_geoparquet,
+}
+
+def fixture_path(file_format, kind, size_name):
+    return os.path.join(FIXTURE_DIR, f"{kind}_{size_name}.{file_format}")
+
+def ensure_fixture(file_format, kind, size_name):
+    # Sinh file một lần rồi dùng lại cho các lần chạy sau
+    path = fixture_path(file_format, kind, size_name)
+    if not os.path.exists(path):
+        os.makedirs(FIXTURE_DIR, exist_ok=True)
+        # Giữ nguyên phần mở rộng để GDAL nhận đúng driver
+        tmp_path = path[:-len(file_format)] + 'tmp.' + file_format
+        WRITERS[file_format](tmp_path, make_chunks(kind, SIZES[size_name]))
+        os.replace(tmp_path, path)
+    return path
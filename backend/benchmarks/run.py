@@ -0,0 +1,171 @@
+import os
+import sys
+import json
+import time
+import argparse
+import platform
+import resource
+import subprocess
+import multiprocessing
+from datetime import datetime
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+
+from benchmarks.fixtures import SIZES, GEOMETRY_KINDS, FORMATS, ensure_fixture
+
+# Đo thông lượng import theo từng bước: parse (đọc file + giải mã geometry), transform
+# (chuyển hệ toạ độ), validate (kiểm tra/sửa geometry) và insert (mã hoá EWKB + INSERT
+# nhiều dòng vào PostGIS, rollback khi xong).
+#   python -m benchmarks.run --sizes 1k,100k --insert --compare benchmarks/results/<cũ>.json
+STAGES = ('parse', 'transform', 'validate', 'insert')
+RESULTS_DIR = os.path.join(os.path.dirname(__file__), "results")
+
+def timed(iterable, cumulative, stage):
+    # Cộng dồn thời gian chờ next() của một bước; con số này gồm cả các bước phía trước
+    # trong pipeline, thời gian riêng của bước được tính bằng phép trừ ở run_case
+    iterator = iter(iterable)
+    while True:
+        started = time.perf_counter()
+        try:
+            item = next(iterator)
+        except StopIteration:
+            cumulative[stage] += time.perf_counter() - started
+            return
+        cumulative[stage] += time.perf_counter() - started
+        yield item
+
+def peak_rss_mb():
+    # VmHWM là đỉnh RSS của riêng process này; ru_maxrss trên Linux còn giữ đỉnh của
+    # process cha qua fork/exec nên chỉ dùng khi không có /proc (KB trên Linux, byte trên macOS)
+    try:
+        with open('/proc/self/status') as status:
+            for line in status:
+                if line.startswith('VmHWM:'):
+                    return round(int(line.split()[1]) / 1024, 1)
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return round(peak / (1024 * 1024 if sys.platform == 'darwin' else 1024), 1)
+
+def run_case(path, file_format, insert):
+    # Chạy trong process riêng để peak RSS là của đúng một trường hợp
+    from utils.file_processor import get_parser
+    from utils.bulk_insert import iter_feature_batches, encode_feature_batch, feature_insert_statement, INSERT_BATCH_SIZE
+    from utils.reprojection import reproject_batches
+    from utils.geometry_validation import new_validation_report, validate_batches
+
+    cumulative = dict.fromkeys(STAGES, 0.0)
+    report = new_validation_report()
+    count = 0
+    db = None
+    if insert:
+        from model.connect import SessionLocal
+        db = SessionLocal()
+        stmt = feature_insert_statement(return_rows=False)
+    started = time.perf_counter()
+    try:
+        with open(path, 'rb') as file_like:
+            feature_batches = timed(iter_feature_batches(get_parser(file_format)(file_like), file_format), cumulative, 'parse')
+            feature_batches = timed(reproject_batches(feature_batches), cumulative, 'transform')
+            feature_batches = timed(validate_batches(feature_batches, report), cumulative, 'validate')
+            for feature_batch in feature_batches:
+                count += len(feature_batch.names)
+                if db is not None:
+                    insert_started = time.perf_counter()
+                    rows = encode_feature_batch(None, feature_batch)
+                    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+                        db.execute(stmt, rows[start:start + INSERT_BATCH_SIZE])
+                    cumulative['insert'] += time.perf_counter() - insert_started
+    finally:
+        if db is not None:
+            db.rollback()
+            db.close()
+    elapsed = time.perf_counter() - started
+
+    seconds = {
+        'parse': cumulative['parse'],
+        'transform': cumulative['transform'] - cumulative['parse'],
+        'validate': cumulative['validate'] - cumulative['transform'],
+        'insert': cumulative['insert'] if insert else None,
+    }
+    return {
+        'features': count,
+        'seconds': round(elapsed, 3),
+        'features_per_second': round(count / elapsed, 1) if elapsed > 0 else None,
+        'stages': {
+            stage: None if value is None else {
+                'seconds': round(value, 3),
+                'features_per_second': round(count / value, 1) if value > 0 else None,
+            }
+            for stage, value in seconds.items()
+        },
+        'validation': {key: report[key] for key in ('checked', 'invalid', 'repaired', 'dropped_empty')},
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=os.path.dirname(__file__), text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def case_key(case):
+    return (case['format'], case['geometry'], case['size'])
+
+def compare_results(baseline, current):
+    # In tỉ lệ features/s của từng bước so với lần chạy trước (< 1 là chậm đi)
+    previous = {case_key(case): case for case in baseline['cases']}
+    print(f"{'case':<28}{'stage':<10}{'before':>12}{'after':>12}{'ratio':>8}")
+    for case in current['cases']:
+        old = previous.get(case_key(case))
+        if not old:
+            continue
+        for stage in ('total',) + STAGES:
+            before = old['features_per_second'] if stage == 'total' else (old['stages'].get(stage) or {}).get('features_per_second')
+            after = case['features_per_second'] if stage == 'total' else (case['stages'].get(stage) or {}).get('features_per_second')
+            if not before or not after:
+                continue
+            print(f"{'/'.join(case_key(case)):<28}{stage:<10}{before:>12.1f}{after:>12.1f}{after / before:>8.2f}")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Import throughput benchmark")
+    parser.add_argument('--sizes', default='1k,100k', help=f"comma separated, from {', '.join(SIZES)}")
+    parser.add_argument('--geometries', default=','.join(GEOMETRY_KINDS))
+    parser.add_argument('--formats', default=','.join(FORMATS))
+    parser.add_argument('--insert', action='store_true', help="also insert into the database configured by DB_* (rolled back)")
+    parser.add_argument('--output', help="result file, default benchmarks/results/<time>-<commit>.json")
+    parser.add_argument('--compare', help="earlier result file to compare against")
+    args = parser.parse_args(argv)
+
+    commit = git_commit()
+    result = {
+        'commit': commit,
+        'created_at': datetime.utcnow().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'insert': args.insert,
+        'cases': [],
+    }
+    context = multiprocessing.get_context('spawn')
+    for size_name in args.sizes.split(','):
+        for kind in args.geometries.split(','):
+            for file_format in args.formats.split(','):
+                path = ensure_fixture(file_format, kind, size_name)
+                with context.Pool(1) as pool:
+                    case = pool.apply(run_case, (path, file_format, args.insert))
+                case.update({'format': file_format, 'geometry': kind, 'size': size_name, 'file_bytes': os.path.getsize(path)})
+                result['cases'].append(case)
+                print(f"{file_format:<8}{kind:<9}{size_name:<6}{case['features']:>9} features {case['features_per_second']:>10} f/s  peak {case['peak_rss_mb']} MB")
+
+    output = args.output or os.path.join(RESULTS_DIR, f"{datetime.utcnow():%Y%m%dT%H%M%S}-{commit or 'unknown'}.json")
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as out:
+        json.dump(result, out, indent=2)
+    print(f"Saved {output}")
+
+    if args.compare:
+        with open(args.compare) as baseline:
+            compare_results(json.load(baseline), result)
+
+if __name__ == '__main__':
+    main()
@@ -12,6 +12,8 @@ from model.layers import Layer
 from model.default_vector_layer_inform import DefaultVectorLayerInform
 from model.layer_community import LayerCommunity
 from model.feature_community import FeatureCommunity
+from utils.geometry_store import purge_unreferenced_geometries
+from utils.chunked_upload import expire_upload_sessions
 
 app = FastAPI()
 
@@ -55,10 +57,16 @@ def delete_inactive_old_records():
             FeatureCommunity.updated_at < thirty_days_ago
         ).delete(synchronize_session=False)
         
+        # Geometry chung không còn feature nào trỏ tới (sau khi xoá layer ở trên hoặc feature đã sửa geometry)
+        deleted_geometries = purge_unreferenced_geometries(session)
+
+        # Upload dở dang bị bỏ (không finalize) cùng các chunk trên đĩa
+        expired_uploads = expire_upload_sessions(session)
+        
         session.commit()
         
-        logging.info(f"Deleted {deleted_projects} projects, {deleted_layers} layers, {deleted_vector_informs} vector informs, {deleted_layer_communities} layer communities, {deleted_feature_communities} feature communities")
-        print(f"Deleted {deleted_projects} projects, {deleted_layers} layers, {deleted_vector_informs} vector informs, {deleted_layer_communities} layer communities, {deleted_feature_communities} feature communities successfully")
+        logging.info(f"Deleted {deleted_projects} projects, {deleted_layers} layers, {deleted_vector_informs} vector informs, {deleted_layer_communities} layer communities, {deleted_feature_communities} feature communities, {deleted_geometries} shared geometries, {expired_uploads} expired uploads")
+        print(f"Deleted {deleted_projects} projects, {deleted_layers} layers, {deleted_vector_informs} vector informs, {deleted_layer_communities} layer communities, {deleted_feature_communities} feature communities, {deleted_geometries} shared geometries, {expired_uploads} expired uploads successfully")
         
     except Exception as e:
         session.rollback()
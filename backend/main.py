@@ -2,8 +2,9 @@ from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from routers import auth, user, news, projects, layers, features, weather, default_vector_layer_inform_router, default_vector_layer_router, default_feature_router
-from routers import default_feature_settings_router, feature_informs_router, feature_community, layer_community, community_access_control, service_map, check_in, favourite_place
+from routers import default_feature_settings_router, feature_informs_router, feature_community, layer_community, community_access_control, service_map, check_in, favourite_place, imports, uploads, tiles, cache
 from db_task_scheduler import delete_inactive_records
+from utils import import_jobs
 from apscheduler.schedulers.background import BackgroundScheduler
 import requests
 import logging
@@ -17,6 +18,7 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "ETag"],
 )
 
 # Cấu hình Session Middleware
@@ -46,6 +48,10 @@ app.include_router(community_access_control.router)
 app.include_router(service_map.router)
 app.include_router(check_in.router)
 app.include_router(favourite_place.router)
+app.include_router(imports.router)
+app.include_router(uploads.router)
+app.include_router(tiles.router)
+app.include_router(cache.router)
 # Cấu hình scheduler
 scheduler = BackgroundScheduler()
 scheduler.add_job(
@@ -56,21 +62,33 @@ scheduler.add_job(
     second=0,
     timezone='Asia/Ho_Chi_Minh'
 )
+# Gia hạn các import job đang chạy và nhận lại job bị bỏ dở (process chạy nó đã chết/restart)
+scheduler.add_job(
+    import_jobs.requeue_stale_import_jobs,
+    'interval',
+    seconds=import_jobs.LEASE_RENEW_INTERVAL.total_seconds()
+)
 
 # Gọi endpoint khi server khởi động
 @app.on_event("startup")
 async def startup_event():
+    scheduler.start()
+    print("Scheduler started. Running deletion job at 2:00 AM daily...")
     try:
         requests.get("http://localhost:8001/delete-inactive")
-        scheduler.start()
-        print("Scheduler started. Running deletion job at 2:00 AM daily...")
     except Exception as e:
         print(f"Error during startup deletion: {str(e)}")
+    try:
+        resumed = import_jobs.resume_import_jobs()
+        print(f"Resumed {resumed} pending import jobs")
+    except Exception as e:
+        print(f"Error while resuming import jobs: {str(e)}")
 
 # Dừng scheduler khi server tắt
 @app.on_event("shutdown")
 async def shutdown_event():
     scheduler.shutdown()
+    import_jobs.executor.shutdown(wait=False, cancel_futures=True)
 
 @app.get("/")
 async def root():
@@ -6,7 +6,10 @@ from .default_feature import DefaultFeature
 from .default_vector_layer import DefaultVectorLayer
 from .default_vector_layer_inform import DefaultVectorLayerInform
 from .features import Feature
+from .geometry_store import GeometryStore
 from .layer_types import LayerType
 from .layers import Layer
 from .users import User
-from .user_role import UserRole
\ No newline at end of file
+from .user_role import UserRole
+from .import_jobs import ImportJob
+from .upload_sessions import UploadSession
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP
+from sqlalchemy import Column, Integer, BigInteger, String, TIMESTAMP
 from sqlalchemy.sql import func
 from model.connect import Base
 
@@ -7,5 +7,7 @@ class DefaultVectorLayer(Base):
 
     default_layer_id = Column(Integer, primary_key=True, autoincrement=True)
     default_layer_name = Column(String(255), nullable=False)
+    # Tăng mỗi lần default_feature của layer thay đổi, dùng làm ETag
+    version = Column(BigInteger, nullable=False, default=1, server_default='1')
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
\ No newline at end of file
@@ -1,17 +1,26 @@
-from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, JSON
+from sqlalchemy import Column, Integer, String, TIMESTAMP, ForeignKey, JSON, Index
 from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
 from sqlalchemy.dialects.postgresql import JSONB
 from geoalchemy2 import Geometry
 from model.connect import Base
 
 class Feature(Base):
     __tablename__ = "features"
+    # GIST index cho lọc theo bbox (/features/by-ids, tile)
+    __table_args__ = (Index('idx_features_geom', 'geom', postgresql_using='gist'),)
     feature_id = Column(Integer, primary_key=True, autoincrement=True)
     feature_name = Column(String(255))
-    layer_id = Column(Integer, ForeignKey("layers.layer_id", ondelete="CASCADE"))
+    layer_id = Column(Integer, ForeignKey("layers.layer_id", ondelete="CASCADE"), index=True)
     properties = Column(JSONB)
     feature_fill = Column(String(10))
     feature_stroke = Column(String(10))
-    geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326))
+    geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False))
+    # Bản đơn giản hoá của geom cho các mức zoom thấp (xem utils/geometry_levels.py)
+    geom_lod1 = deferred(Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False)))
+    geom_lod2 = deferred(Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False)))
+    geom_lod3 = deferred(Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False)))
+    # Feature dùng geometry chung thì geom (và các mức lod) để NULL, đọc qua geometry_store
+    geom_hash = Column(String(32), ForeignKey("geometry_store.geom_hash"), index=True)
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
\ No newline at end of file
@@ -0,0 +1,17 @@
+from sqlalchemy import Column, String, TIMESTAMP, Index
+from sqlalchemy.sql import func
+from sqlalchemy.orm import deferred
+from geoalchemy2 import Geometry
+from model.connect import Base
+
+class GeometryStore(Base):
+    # Geometry dùng chung, định danh bằng md5 của EWKB; các feature sao chép từ cộng đồng
+    # chỉ giữ geom_hash trỏ vào đây thay vì nhân bản geom
+    __tablename__ = "geometry_store"
+    __table_args__ = (Index('idx_geometry_store_geom', 'geom', postgresql_using='gist'),)
+    geom_hash = Column(String(32), primary_key=True)
+    geom = Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False))
+    geom_lod1 = deferred(Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False)))
+    geom_lod2 = deferred(Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False)))
+    geom_lod3 = deferred(Column(Geometry(geometry_type='GEOMETRY', srid=4326, spatial_index=False)))
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
@@ -0,0 +1,25 @@
+from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, Float, Text
+from sqlalchemy.sql import func
+from sqlalchemy.dialects.postgresql import JSONB
+from model.connect import Base
+
+class ImportJob(Base):
+    __tablename__ = "import_jobs"
+    job_id = Column(Integer, primary_key=True, autoincrement=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"))
+    layer_id = Column(Integer, ForeignKey("layers.layer_id", ondelete="SET NULL"))
+    file_name = Column(String(255))
+    file_path = Column(String(500), nullable=False)
+    extension = Column(String(20), nullable=False)
+    mode = Column(String(20), nullable=False, default="single")  # single | multi_layer
+    stage = Column(String(20), nullable=False, default="queued")  # queued | parsing | inserting | done | failed
+    feature_count = Column(Integer, default=0)
+    features_per_second = Column(Float)
+    error = Column(Text)
+    # Chế độ multi_layer: {tên layer nguồn: {layer_id, stage, feature_count, features_per_second, error}}
+    layer_progress = Column(JSONB)
+    # Thống kê import khi xong: throughput, CRS nguồn, báo cáo kiểm tra/sửa geometry
+    report = Column(JSONB)
+    delete_layer_on_failure = Column(Boolean, default=False)
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, TIMESTAMP, ForeignKey, LargeBinary
 from sqlalchemy.sql import func
 from model.connect import Base
 
@@ -13,5 +13,7 @@ class Layer(Base):
     z_index = Column(Integer)
     layer_type = Column(String(10), ForeignKey("layer_types.layer_type_id", ondelete="CASCADE"))
     user_layer_status = Column(Boolean, default=True)
+    # Tăng mỗi lần feature hoặc style thay đổi (utils/versions.py), dùng làm ETag
+    version = Column(BigInteger, nullable=False, default=1, server_default='1')
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
\ No newline at end of file
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, TIMESTAMP, ForeignKey, LargeBinary
+from sqlalchemy import Column, Integer, BigInteger, String, Boolean, TIMESTAMP, ForeignKey, LargeBinary
 from sqlalchemy.sql import func
 from model.connect import Base
 
@@ -10,5 +10,7 @@ class Project(Base):
     project_img = Column(LargeBinary)
     project_type = Column(String(10), ForeignKey("project_types.project_type_id", ondelete="CASCADE"))
     project_status = Column(Boolean, default=True)
+    # Tăng mỗi lần layer (hoặc feature của layer) trong project thay đổi, dùng làm ETag
+    version = Column(BigInteger, nullable=False, default=1, server_default='1')
     created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
     updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
\ No newline at end of file
@@ -0,0 +1,18 @@
+from sqlalchemy import Column, Integer, String, BigInteger, TIMESTAMP, ForeignKey
+from sqlalchemy.sql import func
+from model.connect import Base
+
+class UploadSession(Base):
+    __tablename__ = "upload_sessions"
+    upload_id = Column(String(36), primary_key=True)
+    user_id = Column(Integer, ForeignKey("users.user_id", ondelete="CASCADE"))
+    file_name = Column(String(255), nullable=False)
+    extension = Column(String(20), nullable=False)
+    total_size = Column(BigInteger, nullable=False)
+    chunk_size = Column(Integer, nullable=False)
+    total_chunks = Column(Integer, nullable=False)
+    sha256 = Column(String(64))
+    status = Column(String(20), nullable=False, default="uploading")  # uploading | assembling | finalized
+    job_id = Column(Integer, ForeignKey("import_jobs.job_id", ondelete="SET NULL"))
+    created_at = Column(TIMESTAMP, server_default=func.current_timestamp())
+    updated_at = Column(TIMESTAMP, server_default=func.current_timestamp(), onupdate=func.current_timestamp())
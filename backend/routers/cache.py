@@ -0,0 +1,11 @@
+from fastapi import Depends, APIRouter
+from utils.utils import get_current_user, oauth2_scheme
+from utils.response_cache import response_cache_stats
+
+router = APIRouter(prefix="/cache", tags=["cache"])
+
+# Số liệu của cache response layer trong process này (hit ratio, dung lượng, số lần bị đẩy ra)
+@router.get("/stats")
+async def get_cache_stats(token: str = Depends(oauth2_scheme)):
+    current_user = await get_current_user(token)
+    return response_cache_stats()
@@ -1,14 +1,21 @@
-from typing import List
-from fastapi import APIRouter, Depends, HTTPException, status
+import json
+from typing import List, Optional
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Header, Response
 from sqlalchemy.orm import Session
-from sqlalchemy import or_
+from sqlalchemy import or_, cast
 from pydantic import BaseModel
 from model.default_feature import DefaultFeature 
+from model.default_vector_layer import DefaultVectorLayer
 from model.connect import get_db
 from utils.utils import get_current_user, oauth2_scheme
 from geoalchemy2.functions import ST_Intersects, ST_GeomFromText
 from geoalchemy2 import Geometry
 from geoalchemy2.functions import ST_AsGeoJSON
+from utils.default_tiles import invalidate_default_tiles
+from utils.versions import bump_default_layer_versions, make_etag, etag_matches, etag_headers, not_modified
+from utils.precision import DEFAULT_PRECISION, MAX_PRECISION
+from utils.response_cache import cached_body, cache_key, default_layer_tag
+from sqlalchemy.dialects.postgresql import JSON
 router = APIRouter(prefix="/default-features", tags=["default-features"])
 
 # Pydantic models for request and response
@@ -100,8 +107,10 @@ async def create_feature(
     current_user = await get_current_user(token)
     feature = DefaultFeature(**feature_data.dict())
     db.add(feature)
+    bump_default_layer_versions(db, [feature.layer_id])
     db.commit()
     db.refresh(feature)
+    invalidate_default_tiles(feature.layer_id)
     return feature
 
 @router.put("/{feature_id}", response_model=DefaultFeatureResponse)
@@ -116,11 +125,15 @@ async def update_feature(
     if not feature:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found")
     
+    # Feature có thể chuyển sang layer khác: xoá cache tile của cả hai layer
+    previous_layer_id = feature.layer_id
     for key, value in feature_data.dict(exclude_unset=True).items():
         setattr(feature, key, value)
+    bump_default_layer_versions(db, [previous_layer_id, feature.layer_id])
     
     db.commit()
     db.refresh(feature)
+    invalidate_default_tiles(previous_layer_id, feature.layer_id)
     return feature
 
 @router.delete("/{feature_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -134,8 +147,11 @@ async def delete_feature(
     if not feature:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found")
     
+    layer_id = feature.layer_id
+    bump_default_layer_versions(db, [layer_id])
     db.delete(feature)
     db.commit()
+    invalidate_default_tiles(layer_id)
     return None
 
 # Additional Endpoints
@@ -154,32 +170,53 @@ async def get_features_by_layer(
 @router.post("/by-layer-ids", response_model=List[dict])
 async def get_features_by_layer_ids(
     layer_ids: List[int],
+    precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION),
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
     current_user = await get_current_user(token)
-    features = db.query(
-        DefaultFeature.id,
-        DefaultFeature.GID_1,
-        DefaultFeature.GID_0,
-        DefaultFeature.COUNTRY,
-        DefaultFeature.NAME_1,
-        DefaultFeature.VARNAME_1,
-        DefaultFeature.NL_NAME_1,
-        DefaultFeature.TYPE_1,
-        DefaultFeature.ENGTYPE_1,
-        DefaultFeature.CC_1,
-        DefaultFeature.HASC_1,
-        DefaultFeature.ISO_1,
-        DefaultFeature.layer_id,
-        ST_AsGeoJSON(DefaultFeature.geom).label('geometry')
-    ).filter(DefaultFeature.layer_id.in_(layer_ids)).all()
-    
-    if not features:
+    # ETag từ version của các layer: dữ liệu không đổi thì trả 304, không đọc default_feature
+    versions = dict(db.query(DefaultVectorLayer.default_layer_id, DefaultVectorLayer.version).filter(DefaultVectorLayer.default_layer_id.in_(layer_ids)).all())
+    headers = etag_headers(make_etag('default-features', [(layer_id, versions.get(layer_id)) for layer_id in layer_ids], precision))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+
+    def layer_features(layer_id):
+        # Các feature của một layer dưới dạng đoạn JSON (không có cặp []) để ghép với layer khác
+        features = db.query(
+            DefaultFeature.id,
+            DefaultFeature.GID_1,
+            DefaultFeature.GID_0,
+            DefaultFeature.COUNTRY,
+            DefaultFeature.NAME_1,
+            DefaultFeature.VARNAME_1,
+            DefaultFeature.NL_NAME_1,
+            DefaultFeature.TYPE_1,
+            DefaultFeature.ENGTYPE_1,
+            DefaultFeature.CC_1,
+            DefaultFeature.HASC_1,
+            DefaultFeature.ISO_1,
+            DefaultFeature.layer_id,
+            ST_AsGeoJSON(DefaultFeature.geom, precision).label('geometry')
+        ).filter(DefaultFeature.layer_id == layer_id).order_by(DefaultFeature.id).all()
+        return ','.join(json.dumps(feature._asdict(), ensure_ascii=False, separators=(',', ':')) for feature in features).encode()
+
+    # Mỗi layer được cache riêng theo (layer, version, precision) nên tổ hợp layer_ids khác nhau vẫn dùng lại được
+    fragments = [
+        cached_body(
+            cache_key('default-features', layer_id, versions[layer_id], 'geojson', precision),
+            default_layer_tag(layer_id),
+            lambda layer_id=layer_id: layer_features(layer_id)
+        )
+        for layer_id in dict.fromkeys(layer_ids) if layer_id in versions
+    ]
+    fragments = [fragment for fragment in fragments if fragment]
+
+    if not fragments:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No features found for these layer IDs")
-    
-    # Chuyển Row objects thành dictionary
-    return [feature._asdict() for feature in features]
+
+    return Response(content=b'[' + b','.join(fragments) + b']', media_type="application/json", headers=headers)
 
 @router.post("/feature_ids-by-layer-ids", response_model=List[LayerFeatureResponse])
 async def get_feature_ids_by_layer_ids(
@@ -215,13 +252,15 @@ async def get_feature_ids_by_layer_ids(
 @router.post("/by-spatial", response_model=List[DefaultFeatureResponse])
 async def get_features_by_spatial(
     query: SpatialQueryRequest,
+    precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION),
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
     current_user = await get_current_user(token)
     try:
-        # Tạo truy vấn cơ bản
-        query_builder = db.query(DefaultFeature)
+        # Tạo truy vấn cơ bản; geometry được PostGIS xuất GeoJSON theo precision
+        columns = [column for column in DefaultFeature.__table__.columns if column.key != 'geom']
+        query_builder = db.query(*columns, cast(ST_AsGeoJSON(DefaultFeature.geom, precision), JSON).label('geom'))
         
         # Thêm điều kiện không gian
         query_builder = query_builder.filter(
@@ -237,6 +276,6 @@ async def get_features_by_spatial(
         if not features:
             raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No features found for this spatial query")
         
-        return features
+        return [feature._asdict() for feature in features]
     except Exception as e:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid WKT format or spatial query error: {str(e)}")
\ No newline at end of file
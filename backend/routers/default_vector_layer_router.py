@@ -5,6 +5,8 @@ from typing import Optional, List
 from model.default_vector_layer import DefaultVectorLayer
 from model.connect import get_db
 from utils.utils import get_current_user, oauth2_scheme
+from utils.default_tiles import invalidate_default_tiles
+from utils.versions import bump_default_layer_versions
 
 router = APIRouter(prefix="/default-vector-layers", tags=["default-vector-layers"])
 
@@ -82,6 +84,7 @@ async def update_default_vector_layer(
     
     for key, value in layer.dict(exclude_unset=True).items():
         setattr(db_layer, key, value)
+    bump_default_layer_versions(db, [default_layer_id])
     
     db.commit()
     db.refresh(db_layer)
@@ -100,4 +103,5 @@ async def delete_default_vector_layer(
     
     db.delete(db_layer)
     db.commit()
+    invalidate_default_tiles(default_layer_id)
     return {"message": "Default vector layer deleted successfully"}
\ No newline at end of file
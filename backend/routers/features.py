@@ -1,6 +1,7 @@
-from fastapi import Depends, HTTPException, status, APIRouter, Query, UploadFile, File, Form
-from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from fastapi import Depends, HTTPException, status, APIRouter, Query, UploadFile, File, Form, Response, Header
+from sqlalchemy import func
+from sqlalchemy.orm import Session, defer
+from pydantic import BaseModel, Field
 from typing import Optional, Dict, List
 from model.features import Feature
 from model.layers import Layer
@@ -8,12 +9,28 @@ from model.projects import Project
 from model.connect import get_db
 from utils.utils import get_current_user, oauth2_scheme
 from geoalchemy2.shape import from_shape, to_shape
-from utils.file_processor import process_json, process_kmz, process_gpkg, process_zip
+from utils.file_processor import PARSERS, get_extension, get_parser, FeatureBatch
+from utils.bulk_insert import bulk_insert_features, should_return_features, serialize_inserted_rows, query_feature_rows, clone_features, feature_ids_filter, encode_feature_batch, feature_insert_statement
+from utils.geometry_validation import repair_geometries
+from utils.import_preview import preview_import, PREVIEW_MODES, PREVIEW_SAMPLE_SIZE
+from utils.import_jobs import create_import_job
+from utils.geometry_levels import geometry_for, refresh_geometry_levels, level_columns
+from utils.geometry_store import geometry_overlaps
+from utils.feature_json import grouped_features_query, feature_query, layer_group_body
+from utils.response_cache import cached_body, cache_key, layer_tag
+from utils.precision import DEFAULT_PRECISION, MAX_PRECISION
+from utils.feature_formats import negotiate_format, binary_features_response
+from utils.versions import bump_layer_versions, make_etag, etag_matches, etag_headers, not_modified
 from shapely.geometry import shape, mapping
 import json
+import numpy as np
+import shapely
 
 router = APIRouter(prefix="/features", tags=["features"])
 
+# Số feature tối đa mỗi trang của /by-ids khi phân trang
+MAX_PAGE_SIZE = 10000
+
 class FeatureCreate(BaseModel):
     layer_id: int
     feature_name: Optional[str] = None
@@ -37,6 +54,12 @@ class UploadFeatureForm(BaseModel):
     layer_id: int
     layer_community_id: Optional[int] = None
     feature_community_id: Optional[int] = None
+    background: bool = False
+    # Không gửi: trả lại feature cho file upload nhỏ; file lớn và bản sao chỉ trả số lượng và id
+    return_features: Optional[bool] = None
+    preview: bool = False
+    preview_mode: str = 'head'
+    preview_size: int = Field(PREVIEW_SAMPLE_SIZE, gt=0, le=100000)
 
 @router.post("/")
 async def create_feature(feature: FeatureCreate, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -50,30 +73,30 @@ async def create_feature(feature: FeatureCreate, token: str = Depends(oauth2_sch
     
     db_feature = Feature(**feature.dict())
     db.add(db_feature)
+    db.flush()
+    refresh_geometry_levels(db, Feature.feature_id == db_feature.feature_id)
+    bump_layer_versions(db, [db_feature.layer_id])
     db.commit()
     db.refresh(db_feature)
     return db_feature
 
 @router.get("/{feature_id}")
-async def get_feature(feature_id: int, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_feature(
+    feature_id: int,
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    tolerance: Optional[float] = Query(None, gt=0),
+    precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
     current_user = await get_current_user(token)
     user_id = current_user.get("user_id")
     
-    feature = db.query(Feature).filter(Feature.feature_id == feature_id).first()
-    if not feature:
+    # zoom/tolerance chọn mức geometry đơn giản hoá đã lưu sẵn; JSON dựng sẵn trong PostGIS
+    body = db.execute(feature_query(geometry_for(zoom, tolerance), Feature.feature_id == feature_id, precision=precision)).scalar()
+    if body is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found")
-    
-    return {
-        "feature_id": feature.feature_id,
-        "layer_id": feature.layer_id,
-        "feature_name": feature.feature_name,
-        "properties": json.loads(feature.properties) if feature.properties else {},
-        "geom": mapping(to_shape(feature.geom)), # Chuyển WKBElement thành GeoJSON
-        "feature_fill": feature.feature_fill,
-        "feature_stroke": feature.feature_stroke,
-        "created_at": feature.created_at,
-        "updated_at": feature.updated_at
-    }
+    return Response(content=body, media_type="application/json")
 
 @router.put("/{feature_id}")
 async def update_feature(feature_id: int, feature: FeatureUpdate, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -84,9 +107,17 @@ async def update_feature(feature_id: int, feature: FeatureUpdate, token: str = D
     if not db_feature:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found")
     
-    for key, value in feature.dict(exclude_unset=True).items():
+    update_data = feature.dict(exclude_unset=True)
+    for key, value in update_data.items():
         setattr(db_feature, key, value)
     
+    # Geometry thay đổi thì các mức đơn giản hoá cũng phải tính lại; feature đang dùng
+    # geometry chung thì tách ra bản riêng (copy-on-write), geometry_store giữ nguyên
+    if "geom" in update_data:
+        db_feature.geom_hash = None
+        db.flush()
+        refresh_geometry_levels(db, Feature.feature_id == feature_id)
+    bump_layer_versions(db, [db_feature.layer_id])
     db.commit()
     db.refresh(db_feature)
     return db_feature
@@ -100,13 +131,32 @@ async def delete_feature(feature_id: int, token: str = Depends(oauth2_scheme), d
     if not db_feature:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found")
     
+    bump_layer_versions(db, [db_feature.layer_id])
     db.delete(db_feature)
     db.commit()
     return {"message": "Feature deleted successfully"}
 
+def parse_bbox(bbox):
+    # "minx,miny,maxx,maxy" theo EPSG:4326 -> envelope PostGIS
+    try:
+        minx, miny, maxx, maxy = [float(value) for value in bbox.split(',')]
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox must be minx,miny,maxx,maxy")
+    if minx > maxx or miny > maxy:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="bbox min must not exceed max")
+    return func.ST_MakeEnvelope(minx, miny, maxx, maxy, 4326)
+
 @router.post("/by-ids")
 async def get_features_by_layer_ids(
     layer_ids: List[int],  # Nhận mảng layer_ids từ query parameter
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    tolerance: Optional[float] = Query(None, gt=0),
+    bbox: Optional[str] = Query(None, description="minx,miny,maxx,maxy (EPSG:4326)"),
+    limit: Optional[int] = Query(None, gt=0, le=MAX_PAGE_SIZE),
+    cursor: Optional[int] = Query(None, ge=0, description="feature_id cuối của trang trước"),
+    precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION, description="Số chữ số thập phân của toạ độ"),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
     token: str = Depends(oauth2_scheme),
     db: Session = Depends(get_db)
 ):
@@ -121,38 +171,46 @@ async def get_features_by_layer_ids(
     if not layers or len(layers) != len(layer_ids):
         return []
 
-    # Lấy tất cả feature theo mảng layer_ids
-    features = db.query(Feature).filter(Feature.layer_id.in_(layer_ids)).all()
+    # ETag từ version của các layer và mọi tham số: client đã có bản mới nhất thì trả 304
+    # mà không đọc feature nào
+    feature_format = negotiate_format(accept)
+    versions = {layer.layer_id: layer.version for layer in layers}
+    etag = make_etag('by-ids', [(layer_id, versions[layer_id]) for layer_id in layer_ids], zoom, tolerance, bbox, limit, cursor, precision, feature_format)
+    headers = etag_headers(etag, vary="Accept")
+    if etag_matches(if_none_match, etag):
+        return not_modified(headers)
 
-    # Chuyển đổi dữ liệu feature thành định dạng phù hợp cho frontend
-    features_data = [
-        {
-            "feature_id": feature.feature_id,
-            "layer_id": feature.layer_id,
-            "name": feature.feature_name or "Unnamed",
-            "properties": json.loads(feature.properties) if feature.properties else {},
-            "geom": mapping(to_shape(feature.geom))  # Chuyển WKBElement thành GeoJSON
-        }
-        for feature in features
-    ]
+    # Đọc nguyên layer (không lọc, không phân trang): ghép từ cache theo từng layer, layer nào
+    # chưa có thì PostGIS dựng rồi lưu lại
+    if feature_format == 'geojson' and not bbox and not limit and cursor is None:
+        groups = [
+            cached_body(
+                cache_key('by-ids', layer_id, versions[layer_id], feature_format, *level_columns(zoom, tolerance), precision),
+                layer_tag(layer_id),
+                lambda layer_id=layer_id: layer_group_body(db, layer_id, geometry_for(zoom, tolerance), precision)
+            )
+            for layer_id in layer_ids
+        ]
+        return Response(content=b'[' + b','.join(groups) + b']', media_type="application/json", headers=headers)
 
-    # Nhóm features theo layer_id để trả về cấu trúc phù hợp
-    grouped_features = {}
-    for layer in layers:
-        grouped_features[layer.layer_id] = {
-            "layer": {
-                "id": layer.layer_id,
-                "name": layer.layer_name,
-                "fill": layer.fill,
-                "stroke": layer.stroke,
-                "stroke_width": layer.stroke_width,
-                "priority": layer.z_index
-            },
-            "features": [f for f in features_data if f["layer_id"] == layer.layer_id]
-        }
+    # PostGIS dựng toàn bộ JSON (nhóm theo layer, geometry theo zoom/tolerance), chuỗi trả về
+    # được gửi thẳng ra response
+    criteria = []
+    if bbox:
+        criteria.append(geometry_overlaps(parse_bbox(bbox)))
+    # Phân trang keyset theo feature_id: trang sau bắt đầu từ sau cursor, không dùng OFFSET
+    if cursor is not None:
+        criteria.append(Feature.feature_id > cursor)
 
-    # Trả về response
-    return list(grouped_features.values())
+    # FlatGeobuf / GeoArrow theo header Accept: mọi layer chung một file, phân biệt bằng cột layer_id
+    if feature_format != 'geojson':
+        criteria.append(Feature.layer_id.in_(layer_ids))
+        return binary_features_response(db, feature_format, geometry_for(zoom, tolerance), criteria, limit, headers)
+
+    body, next_cursor = db.execute(grouped_features_query(layer_ids, geometry_for(zoom, tolerance), criteria, limit, precision)).one()
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    return Response(content=body, media_type="application/json", headers=headers)
 
 @router.post("/feature-to-layers")
 async def upload_layer(form: Optional[str] = Form(...), file: Optional[UploadFile] = File(None), token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -166,95 +224,95 @@ async def upload_layer(form: Optional[str] = Form(...), file: Optional[UploadFil
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid form data format")
     except ValueError as e:
         raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=str(e))
+    # Chế độ xem trước: chỉ đọc một mẫu của file và thống kê, không ghi vào database
+    if form_model.preview:
+        if not file:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="preview requires a file")
+        extension = get_extension(file.filename)
+        if extension not in PARSERS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+        if form_model.preview_mode not in PREVIEW_MODES:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"preview_mode must be one of {', '.join(PREVIEW_MODES)}")
+        try:
+            preview = preview_import(file.file, extension, get_parser(extension), form_model.preview_mode, form_model.preview_size)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return {
+            "message": "Import preview",
+            "file_name": file.filename,
+            "preview": preview
+        }
     layer = db.query(Layer).filter(Layer.layer_id == form_model.layer_id).first()
     if not layer:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
     print(form_model)
     feature_ids = []
+    features_response = []
+    ingest_stats = None
+    # File lớn: lưu file ra đĩa và xử lý trong import job, trả về job_id ngay
+    if file and form_model.background:
+        extension = get_extension(file.filename)
+        if extension not in PARSERS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+        job = create_import_job(db, user_id, form_model.layer_id, file, extension)
+        return {
+            "message": "Import job queued",
+            "job_id": job.job_id,
+            "layer_id": form_model.layer_id,
+            "feature_count": 0,
+            "features": []
+        }
     # Nếu không có file, trả về ngay với layer_id
     if file:
         print("dòng file này chạy nè")
-        extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+        extension = get_extension(file.filename)
         try:
-            if extension in ['json', 'geojson']:
-                features_data = process_json(file.file)
-            elif extension == 'kmz':
-                features_data = process_kmz(file.file)
-            elif extension == 'gpkg':
-                features_data = process_gpkg(file.file)
-            elif extension == 'zip':
-                features_data = process_zip(file.file)
-            else:
+            if extension not in PARSERS:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+            features_data = get_parser(extension)(file.file)
+            return_features = should_return_features(form_model.return_features, file)
+            # Chèn toàn bộ feature theo lô trong một transaction
+            inserted, ingest_stats = bulk_insert_features(db, form_model.layer_id, features_data, extension, return_rows=return_features, return_ids=not return_features)
+            bump_layer_versions(db, [form_model.layer_id])
+            db.commit()
         except Exception as e:
+            db.rollback()
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-        
-        for feature_data in features_data:
-            geom = feature_data['geometry']
-            shapely_geom = shape(geom) if isinstance(geom, dict) else geom
-            geojson_geom = mapping(shapely_geom)
-            properties = json.dumps(feature_data['properties'])
-            new_feature = Feature(
-                layer_id=form_model.layer_id,
-                feature_name=feature_data['properties'].get('name', 'COUNTRY') if extension == 'kmz' else feature_data['properties'].get('VARNAME_1', 'COUNTRY'),
-                properties=properties,
-                geom=from_shape(shapely_geom, srid=4326),
-            )
-            db.add(new_feature)
-            db.commit()
-            db.refresh(new_feature)
-            feature_ids.append(new_feature)
+        if return_features:
+            features_response = serialize_inserted_rows(inserted)
+        else:
+            feature_ids = inserted
     
     else:
         if form_model.layer_community_id:
             print("dòng layercommunity này chạy nè")
-            features_to_copy = db.query(Feature).filter(Feature.layer_id == form_model.layer_community_id).all()
-            if not features_to_copy:
+            # Sao chép cả layer cộng đồng bằng một câu INSERT ... SELECT
+            feature_ids = clone_features(db, form_model.layer_id, Feature.layer_id == form_model.layer_community_id)
+            if not feature_ids:
+                db.rollback()
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No features found for the given layer_community_id")
-            
-            for feature in features_to_copy:
-                new_feature = Feature(
-                    layer_id=form_model.layer_id,
-                    feature_name=feature.feature_name,
-                    properties=feature.properties,
-                    geom=feature.geom
-                )
-                db.add(new_feature)
-                db.commit()
-                db.refresh(new_feature)
-                feature_ids.append(new_feature)
+            bump_layer_versions(db, [form_model.layer_id])
+            db.commit()
         
         else:
             print("dòng feature này chạy nè")
-            feature_to_copy = db.query(Feature).filter(Feature.feature_id == form_model.feature_community_id).first()
-            if not feature_to_copy:
+            feature_ids = clone_features(db, form_model.layer_id, Feature.feature_id == form_model.feature_community_id)
+            if not feature_ids:
+                db.rollback()
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found for the given feature_community_id")
-            
-            new_feature = Feature(
-                layer_id=form_model.layer_id,
-                feature_name=feature_to_copy.feature_name,
-                properties=feature_to_copy.properties,
-                geom=feature_to_copy.geom
-            )
-            db.add(new_feature)
+            bump_layer_versions(db, [form_model.layer_id])
             db.commit()
-            db.refresh(new_feature)
-            feature_ids.append(new_feature)
         
+    # Bản sao: mặc định chỉ trả về id và số lượng; return_features=true mới đọc lại feature
+    if feature_ids and not file and form_model.return_features:
+        features_response = serialize_inserted_rows(query_feature_rows(db, feature_ids_filter(feature_ids)))
     return {
         "message": "Add features to user kayer successfully",
         "layer_id": form_model.layer_id,
-        "feature_count": len(feature_ids),
-        "features": [
-            {
-                "feature_id": feature.feature_id,
-                "layer_id": feature.layer_id,
-                "name": feature.feature_name,
-                "properties": feature.properties,
-                "geom": mapping(to_shape(feature.geom))
-            }
-            for feature in feature_ids
-        ]
+        "feature_count": len(feature_ids) if feature_ids else len(features_response),
+        "feature_ids": feature_ids,
+        "features": features_response,
+        "ingest": ingest_stats
     }
   
 @router.post("/draw-features")
@@ -265,39 +323,52 @@ async def save_draw_features(
 ):
     current_user = await get_current_user(token)
 
-    saved_features = []
+    if not features:
+        return []
 
+    # Kiểm tra tất cả layer được tham chiếu bằng một truy vấn
+    layer_ids = {item.layer_id for item in features}
+    found_layer_ids = {layer_id for (layer_id,) in db.query(Layer.layer_id).filter(Layer.layer_id.in_(layer_ids))}
     for item in features:
-        layer = db.query(Layer).filter(Layer.layer_id == item.layer_id).first()
-        if not layer:
+        if item.layer_id not in found_layer_ids:
             raise HTTPException(status_code=404, detail=f"Layer {item.layer_id} not found")
 
-        feature_geojson = item.feature
-        geometry = feature_geojson.get("geometry")
-        properties = None
-        if not geometry:
-            raise HTTPException(status_code=400, detail="Feature geometry is missing")
+    # Giải mã và kiểm tra geometry của cả lô theo mảng
+    geometries_geojson = [item.feature.get("geometry") for item in features]
+    if any(not geometry for geometry in geometries_geojson):
+        raise HTTPException(status_code=400, detail="Feature geometry is missing")
+    geometries = shapely.from_geojson([json.dumps(geometry) for geometry in geometries_geojson], on_invalid='ignore')
+    unparsed = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+    if unparsed.any():
+        index = int(np.flatnonzero(unparsed)[0])
+        raise HTTPException(status_code=400, detail=f"Invalid geometry: feature {index} could not be parsed")
+    invalid = ~shapely.is_valid(geometries)
+    if invalid.any():
+        geometries = repair_geometries(geometries, invalid)
+        # make_valid có thể làm geometry suy biến (vd. polygon diện tích 0) thành rỗng,
+        # như validate_batches: không lưu feature rỗng
+        collapsed = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+        if collapsed.any():
+            index = int(np.flatnonzero(collapsed)[0])
+            raise HTTPException(status_code=400, detail=f"Invalid geometry: feature {index} is empty after repair")
 
-        try:
-            shapely_geom = shape(geometry)
-            geom_db = from_shape(shapely_geom, srid=4326)
-        except Exception as e:
-            raise HTTPException(status_code=400, detail=f"Invalid geometry: {e}")
-
-        new_feature = Feature(
-            layer_id=item.layer_id,
-            feature_name='No named',
-            properties=json.dumps(properties),
-            geom=geom_db,
-        )
-
-        db.add(new_feature)
-        db.commit()
-        db.refresh(new_feature)
-
-        saved_features.append({
-            "feature_id": new_feature.feature_id,
-            "layer_id": new_feature.layer_id
-        })
+    # Một câu INSERT nhiều dòng, một lần commit; RETURNING giữ đúng thứ tự đầu vào
+    feature_batch = FeatureBatch(
+        names=['No named'] * len(features),
+        properties=[json.dumps(None)] * len(features),
+        geometries=geometries,
+    )
+    rows = encode_feature_batch(None, feature_batch)
+    for row, item in zip(rows, features):
+        row['layer_id'] = item.layer_id
+    feature_ids = db.execute(feature_insert_statement(return_rows=False), rows).scalars().all()
+    bump_layer_versions(db, found_layer_ids)
+    db.commit()
 
-    return saved_features
\ No newline at end of file
+    return [
+        {
+            "feature_id": feature_id,
+            "layer_id": item.layer_id
+        }
+        for feature_id, item in zip(feature_ids, features)
+    ]
@@ -0,0 +1,37 @@
+from fastapi import Depends, HTTPException, status, APIRouter
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional, Dict
+from model.import_jobs import ImportJob
+from model.connect import get_db
+from utils.utils import get_current_user, oauth2_scheme
+from datetime import datetime
+
+router = APIRouter(prefix="/imports", tags=["imports"])
+
+class ImportJobResponse(BaseModel):
+    job_id: int
+    layer_id: Optional[int] = None
+    file_name: Optional[str] = None
+    mode: Optional[str] = None
+    stage: str
+    feature_count: Optional[int] = None
+    features_per_second: Optional[float] = None
+    error: Optional[str] = None
+    layer_progress: Optional[Dict[str, dict]] = None
+    report: Optional[dict] = None
+    created_at: Optional[datetime] = None
+    updated_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+@router.get("/{job_id}", response_model=ImportJobResponse)
+async def get_import_job(job_id: int, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    current_user = await get_current_user(token)
+    user_id = current_user.get("user_id")
+
+    job = db.query(ImportJob).filter(ImportJob.job_id == job_id, ImportJob.user_id == user_id).first()
+    if not job:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
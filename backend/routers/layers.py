@@ -1,6 +1,6 @@
-from fastapi import Depends, HTTPException, status, APIRouter, UploadFile, File, Form
+from fastapi import Depends, HTTPException, status, APIRouter, UploadFile, File, Form, Query, Header, Response
 from sqlalchemy.orm import Session
-from pydantic import BaseModel
+from pydantic import BaseModel, Field
 from typing import Optional, List
 from model.layers import Layer
 from model.features import Feature
@@ -8,11 +8,20 @@ from model.projects import Project
 from model.connect import get_db
 from utils.utils import get_current_user, oauth2_scheme
 import json
-from utils.file_processor import process_json, process_kmz, process_gpkg, process_zip
+from utils.file_processor import PARSERS, get_extension, get_parser, list_spatial_layers
+from utils.bulk_insert import bulk_insert_features, should_return_features, serialize_inserted_rows, query_feature_rows, clone_features, feature_ids_filter
+from utils.import_preview import preview_import, PREVIEW_MODES, PREVIEW_SAMPLE_SIZE
+from utils.import_jobs import create_import_job, enqueue_import_file, spool_upload, remove_file
 from shapely.geometry import shape, mapping
 from shapely.wkt import dumps
 from geoalchemy2.shape import from_shape, to_shape
 from datetime import datetime
+from utils.geometry_levels import geometry_for, level_columns
+from utils.feature_json import feature_collection_query
+from utils.feature_formats import negotiate_format, binary_features_response, flatgeobuf_body, FLATGEOBUF_MEDIA_TYPE
+from utils.response_cache import cached_body, cache_key, layer_tag, invalidate_layer_responses
+from utils.precision import DEFAULT_PRECISION, MAX_PRECISION
+from utils.versions import bump_layer_versions, bump_project_versions, make_etag, etag_matches, etag_headers, not_modified
 
 router = APIRouter(prefix="/layers", tags=["layers"])
 
@@ -40,6 +49,7 @@ class LayerResponse(BaseModel):
     stroke_width: Optional[int] = None
     z_index: Optional[int] = None
     layer_type: Optional[str] = None
+    version: Optional[int] = None
     created_at: datetime
     updated_at: Optional[datetime] 
 class RecycleLayerResponse(BaseModel):
@@ -63,6 +73,13 @@ class UploadLayerForm(BaseModel):
     project_id: int
     layer_community_id: Optional[int] = None
     feature_community_id: Optional[int] = None
+    background: bool = False
+    all_layers: bool = False
+    # Không gửi: trả lại feature cho file upload nhỏ; file lớn và bản sao chỉ trả số lượng và id
+    return_features: Optional[bool] = None
+    preview: bool = False
+    preview_mode: str = 'head'
+    preview_size: int = Field(PREVIEW_SAMPLE_SIZE, gt=0, le=100000)
 
 @router.get("/recycle", response_model=List[RecycleLayerResponse])
 async def get_recycled_layers(token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
@@ -116,10 +133,47 @@ async def get_layer(layer_id: int, token: str = Depends(oauth2_scheme), db: Sess
         "stroke_width": layer.stroke_width,
         "z_index": layer.z_index,
         "layer_type": layer.layer_type,
+        "version": layer.version,
         "created_at": layer.created_at,
         "updated_at": layer.updated_at
     }
 
+@router.get("/{layer_id}/features")
+async def get_layer_features(
+    layer_id: int,
+    zoom: Optional[int] = Query(None, ge=0, le=24),
+    tolerance: Optional[float] = Query(None, gt=0),
+    precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION),
+    accept: Optional[str] = Header(None),
+    if_none_match: Optional[str] = Header(None),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    current_user = await get_current_user(token)
+
+    layer = db.query(Layer).filter(Layer.layer_id == layer_id, Layer.user_layer_status == True).first()
+    if not layer:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
+
+    # Định dạng theo header Accept: GeoJSON (mặc định), FlatGeobuf hoặc GeoArrow IPC
+    feature_format = negotiate_format(accept)
+    headers = etag_headers(make_etag('layer-features', layer_id, layer.version, zoom, tolerance, precision, feature_format), vary="Accept")
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    criteria = [Feature.layer_id == layer_id]
+    if feature_format == 'arrow':
+        # GeoArrow được stream thẳng từ cursor, không qua cache
+        return binary_features_response(db, feature_format, geometry_for(zoom, tolerance), criteria, headers=headers)
+
+    # GeoJSON và FlatGeobuf dựng xong được cache theo (layer, version, định dạng, mức geometry, precision)
+    if feature_format == 'flatgeobuf':
+        key = cache_key('layer-features', layer_id, layer.version, feature_format, *level_columns(zoom, tolerance))
+        body = cached_body(key, layer_tag(layer_id), lambda: flatgeobuf_body(db, geometry_for(zoom, tolerance), criteria))
+        return Response(content=body, media_type=FLATGEOBUF_MEDIA_TYPE, headers=headers)
+    key = cache_key('layer-features', layer_id, layer.version, feature_format, *level_columns(zoom, tolerance), precision)
+    body = cached_body(key, layer_tag(layer_id), lambda: db.execute(feature_collection_query(geometry_for(zoom, tolerance), criteria, precision)).scalar().encode())
+    return Response(content=body, media_type="application/geo+json", headers=headers)
+
 @router.put("/{layer_id}", response_model=LayerResponse)
 async def update_layer(layer_id: int, layer: LayerUpdate, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     current_user = await get_current_user(token)
@@ -135,6 +189,7 @@ async def update_layer(layer_id: int, layer: LayerUpdate, token: str = Depends(o
 
     for key, value in layer.dict(exclude_unset=True).items():
         setattr(db_layer, key, value)
+    bump_layer_versions(db, [layer_id])
     
     db.commit()
     db.refresh(db_layer)
@@ -149,12 +204,14 @@ async def delete_layer(layer_id: int, token: str = Depends(oauth2_scheme), db: S
     if not db_layer:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
     
+    bump_project_versions(db, [db_layer.project_id])
     db.delete(db_layer)
     db.commit()
+    invalidate_layer_responses([layer_id])
     return {"message": "Layer deleted successfully"}
 
 @router.get("/projects/{project_id}", response_model=List[LayerResponse])
-async def get_layers_by_project(project_id: int, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+async def get_layers_by_project(project_id: int, response: Response, if_none_match: Optional[str] = Header(None), token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
     current_user = await get_current_user(token)
     user_id = current_user.get("user_id")
     print(project_id)
@@ -162,6 +219,11 @@ async def get_layers_by_project(project_id: int, token: str = Depends(oauth2_sch
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     
+    # Version của project tăng khi bất kỳ layer nào trong project thay đổi
+    headers = etag_headers(make_etag('project-layers', project_id, project.version))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    response.headers.update(headers)
     layers = db.query(Layer).filter(Layer.project_id == project_id, Layer.user_layer_status == True).all()
     return [{
         "layer_id": layer.layer_id,
@@ -172,6 +234,7 @@ async def get_layers_by_project(project_id: int, token: str = Depends(oauth2_sch
         "stroke_width": layer.stroke_width,
         "z_index": layer.z_index,
         "layer_type": layer.layer_type,
+        "version": layer.version,
         "created_at": layer.created_at,
         "updated_at": layer.updated_at
     } for layer in layers]
@@ -192,6 +255,75 @@ async def upload_layer(form: Optional[str] = Form(...), file: Optional[UploadFil
     if not project:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     print(form_model)
+    # Chế độ xem trước: chỉ đọc một mẫu của file và thống kê, không ghi vào database
+    if form_model.preview:
+        if not file:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="preview requires a file")
+        extension = get_extension(file.filename)
+        if extension not in PARSERS:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+        if form_model.preview_mode not in PREVIEW_MODES:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail=f"preview_mode must be one of {', '.join(PREVIEW_MODES)}")
+        try:
+            preview = preview_import(file.file, extension, get_parser(extension), form_model.preview_mode, form_model.preview_size)
+        except Exception as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        return {
+            "message": "Import preview",
+            "file_name": file.filename,
+            "preview": preview
+        }
+    # GeoPackage nhiều layer: tạo một Layer cho mỗi layer nguồn và import song song trong job nền
+    if file and form_model.all_layers:
+        if get_extension(file.filename) != 'gpkg':
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="all_layers is only supported for GeoPackage files")
+        file_path = spool_upload(file, 'gpkg')
+        try:
+            source_layers = list_spatial_layers(file_path)
+        except Exception as e:
+            remove_file(file_path)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        if not source_layers:
+            remove_file(file_path)
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="GeoPackage has no spatial layers")
+        created_layers = []
+        for index, source_layer in enumerate(source_layers):
+            layer = Layer(
+                project_id=form_model.project_id,
+                layer_name=f"{form_model.name} - {source_layer}" if len(source_layers) > 1 else form_model.name,
+                fill=form_model.fill_color,
+                stroke=form_model.stroke_color,
+                stroke_width=form_model.stroke_width,
+                z_index=form_model.priority + index,
+                layer_type='L001',
+            )
+            db.add(layer)
+            created_layers.append((source_layer, layer))
+        bump_project_versions(db, [form_model.project_id])
+        db.commit()
+        layer_progress = {
+            source_layer: {"layer_id": layer.layer_id, "stage": "queued", "feature_count": 0}
+            for source_layer, layer in created_layers
+        }
+        job = enqueue_import_file(db, user_id, None, file_path, file.filename, 'gpkg', delete_layer_on_failure=True, layer_progress=layer_progress)
+        return {
+            "message": "Layers created, import job queued",
+            "job_id": job.job_id,
+            "layers": [
+                {
+                    "id": layer.layer_id,
+                    "name": layer.layer_name,
+                    "source_layer": source_layer,
+                    "fill": layer.fill,
+                    "stroke": layer.stroke,
+                    "stroke_width": layer.stroke_width,
+                    "priority": layer.z_index,
+                }
+                for source_layer, layer in created_layers
+            ],
+            "feature_count": 0,
+            "features": []
+        }
     new_layer = Layer(
         project_id=form_model.project_id,
         layer_name=form_model.name,
@@ -202,87 +334,85 @@ async def upload_layer(form: Optional[str] = Form(...), file: Optional[UploadFil
         layer_type='L001',
     )
     db.add(new_layer)
+    bump_project_versions(db, [form_model.project_id])
     db.commit()
     db.refresh(new_layer)
     layer_id = new_layer.layer_id
     feature_ids = []
+    features_response = []
+    ingest_stats = None
+    # File lớn: lưu file ra đĩa và xử lý trong import job, trả về job_id ngay
+    if file and form_model.background:
+        extension = get_extension(file.filename)
+        if extension not in PARSERS:
+            bump_project_versions(db, [form_model.project_id])
+            db.delete(new_layer)
+            db.commit()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+        job = create_import_job(db, user_id, layer_id, file, extension, delete_layer_on_failure=True)
+        return {
+            "message": "Layer created, import job queued",
+            "job_id": job.job_id,
+            "layer": {
+                "id": new_layer.layer_id,
+                "name": new_layer.layer_name,
+                "fill": new_layer.fill,
+                "stroke": new_layer.stroke,
+                "stroke_width": new_layer.stroke_width,
+                "priority": new_layer.z_index,
+            },
+            "feature_count": 0,
+            "features": []
+        }
     # Nếu không có file, trả về ngay với layer_id
     if file:
         print("dòng file này chạy nè")
-        extension = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
+        extension = get_extension(file.filename)
         try:
-            if extension in ['json', 'geojson']:
-                features_data = process_json(file.file)
-            elif extension == 'kmz':
-                features_data = process_kmz(file.file)
-            elif extension == 'gpkg':
-                features_data = process_gpkg(file.file)
-            elif extension == 'zip':
-                features_data = process_zip(file.file)
-            else:
-                db.delete(new_layer)
-                db.commit()
+            if extension not in PARSERS:
                 raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+            features_data = get_parser(extension)(file.file)
+            return_features = should_return_features(form_model.return_features, file)
+            # Chèn toàn bộ feature theo lô trong một transaction
+            inserted, ingest_stats = bulk_insert_features(db, layer_id, features_data, extension, return_rows=return_features, return_ids=not return_features)
+            bump_layer_versions(db, [layer_id])
+            db.commit()
         except Exception as e:
+            db.rollback()
+            bump_project_versions(db, [form_model.project_id])
             db.delete(new_layer)
             db.commit()
             raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
-        
-        for feature_data in features_data:
-            geom = feature_data['geometry']
-            shapely_geom = shape(geom) if isinstance(geom, dict) else geom
-            geojson_geom = mapping(shapely_geom)
-            properties = json.dumps(feature_data['properties'])
-            new_feature = Feature(
-                layer_id=layer_id,
-                feature_name=feature_data['properties'].get('name', 'COUNTRY') if extension == 'kmz' else feature_data['properties'].get('VARNAME_1', 'COUNTRY'),
-                properties=properties,
-                geom=from_shape(shapely_geom, srid=4326),
-            )
-            db.add(new_feature)
-            db.commit()
-            db.refresh(new_feature)
-            feature_ids.append(new_feature)
+        if return_features:
+            features_response = serialize_inserted_rows(inserted)
+        else:
+            feature_ids = inserted
     
     else:
         if form_model.layer_community_id:
             print("dòng layercommunity này chạy nè")
-            features_to_copy = db.query(Feature).filter(Feature.layer_id == form_model.layer_community_id).all()
-            if not features_to_copy:
+            # Sao chép cả layer cộng đồng bằng một câu INSERT ... SELECT
+            feature_ids = clone_features(db, layer_id, Feature.layer_id == form_model.layer_community_id)
+            if not feature_ids:
+                db.rollback()
+                bump_project_versions(db, [form_model.project_id])
                 db.delete(new_layer)
                 db.commit()
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="No features found for the given layer_community_id")
-            
-            for feature in features_to_copy:
-                new_feature = Feature(
-                    layer_id=layer_id,
-                    feature_name=feature.feature_name,
-                    properties=feature.properties,
-                    geom=feature.geom
-                )
-                db.add(new_feature)
-                db.commit()
-                db.refresh(new_feature)
-                feature_ids.append(new_feature)
+            bump_layer_versions(db, [layer_id])
+            db.commit()
         
         elif form_model.feature_community_id:
             print("dòng feature này chạy nè")
-            feature_to_copy = db.query(Feature).filter(Feature.feature_id == form_model.feature_community_id).first()
-            if not feature_to_copy:
+            feature_ids = clone_features(db, layer_id, Feature.feature_id == form_model.feature_community_id)
+            if not feature_ids:
+                db.rollback()
+                bump_project_versions(db, [form_model.project_id])
                 db.delete(new_layer)
                 db.commit()
                 raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Feature not found for the given feature_community_id")
-            
-            new_feature = Feature(
-                layer_id=layer_id,
-                feature_name=feature_to_copy.feature_name,
-                properties=feature_to_copy.properties,
-                geom=feature_to_copy.geom
-            )
-            db.add(new_feature)
+            bump_layer_versions(db, [layer_id])
             db.commit()
-            db.refresh(new_feature)
-            feature_ids.append(new_feature)
         
         else:
             return {
@@ -298,6 +428,9 @@ async def upload_layer(form: Optional[str] = Form(...), file: Optional[UploadFil
                 "feature_count": 0,
                 "features": []
             }
+    # Bản sao: mặc định chỉ trả về id và số lượng; return_features=true mới đọc lại feature
+    if feature_ids and not file and form_model.return_features:
+        features_response = serialize_inserted_rows(query_feature_rows(db, feature_ids_filter(feature_ids)))
     return {
         "message": "Layer and features created successfully",
         "layer": {
@@ -308,17 +441,10 @@ async def upload_layer(form: Optional[str] = Form(...), file: Optional[UploadFil
             "stroke_width": new_layer.stroke_width,
             "priority": new_layer.z_index,
         },
-        "feature_count": len(feature_ids),
-        "features": [
-            {
-                "feature_id": feature.feature_id,
-                "layer_id": feature.layer_id,
-                "name": feature.feature_name,
-                "properties": feature.properties,
-                "geom": mapping(to_shape(feature.geom))
-            }
-            for feature in feature_ids
-        ]
+        "feature_count": len(feature_ids) if feature_ids else len(features_response),
+        "feature_ids": feature_ids,
+        "features": features_response,
+        "ingest": ingest_stats
     }
   
 @router.patch("/recycle/{layer_id}")
@@ -331,6 +457,7 @@ async def deactivate_layer(layer_id: int, token: str = Depends(oauth2_scheme), d
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
     
     db_layer.user_layer_status = True
+    bump_layer_versions(db, [layer_id])
     
     try:
         db.commit()
@@ -349,6 +476,7 @@ async def deactivate_layer(layer_id: int, token: str = Depends(oauth2_scheme), d
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
     
     db_layer.user_layer_status = False
+    bump_layer_versions(db, [layer_id])
     
     try:
         db.commit()
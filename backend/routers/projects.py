@@ -5,6 +5,7 @@ from typing import Optional, List
 from model import Project, ProjectType, DefaultVectorLayerInform, Layer
 from model.connect import get_db
 from utils.utils import get_current_user, oauth2_scheme
+from utils.versions import bump_layer_versions, bump_project_versions
 import base64
 from datetime import datetime
 
@@ -164,6 +165,7 @@ async def update_project(project_id: int, project: ProjectUpdate, token: str = D
     # Cập nhật các trường khác
     for key, value in project_data.items():
         setattr(db_project, key, value)
+    bump_project_versions(db, [project_id])
     
     # Lưu vào database
     try:
@@ -205,6 +207,7 @@ async def deactivate_project(project_id: int, token: str = Depends(oauth2_scheme
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     
     db_project.project_status = False
+    bump_project_versions(db, [project_id])
     
     try:
         db.commit()
@@ -223,6 +226,7 @@ async def deactivate_project(project_id: int, token: str = Depends(oauth2_scheme
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
     
     db_project.project_status = True
+    bump_project_versions(db, [project_id])
     
     try:
         db.commit()
@@ -278,6 +282,8 @@ async def update_layer_priorities(
                 "z_index": item.priority # z_index mới chính là priority được gửi lên
             })
 
+        bump_layer_versions(db, [item.layer_id for item in request.updates if not item.isDefault])
+        bump_project_versions(db, [project_id])
         db.commit()
 
     except Exception as e:
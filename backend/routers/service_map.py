@@ -1,33 +1,46 @@
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import FileResponse
+from fastapi import APIRouter, HTTPException, Query, Response, Header
+from typing import Optional
+from functools import lru_cache
+import json
 import os
+from utils.precision import DEFAULT_PRECISION, MAX_PRECISION, round_geojson
+from utils.versions import make_etag, etag_matches, etag_headers, not_modified
 
 router = APIRouter(prefix="/service_map", tags=["service_map"])
 
+@lru_cache(maxsize=32)
+def rounded_geojson(file_path, modified, precision):
+    # Đọc và làm tròn toạ độ một lần cho mỗi (file, lần sửa, precision)
+    with open(file_path, encoding="utf-8") as geojson_file:
+        data = json.load(geojson_file)
+    return json.dumps(round_geojson(data, precision), ensure_ascii=False, separators=(',', ':')).encode("utf-8")
+
+def geojson_response(file_path, precision, if_none_match=None):
+    if not os.path.exists(file_path):
+        raise HTTPException(status_code=404, detail=f"File {os.path.basename(file_path)} not found")
+    # File tĩnh: ETag theo thời điểm sửa và kích thước file
+    stat = os.stat(file_path)
+    headers = etag_headers(make_etag('service-map', file_path, stat.st_mtime_ns, stat.st_size, precision), private=False)
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    return Response(content=rounded_geojson(file_path, stat.st_mtime_ns, precision), media_type="application/json", headers=headers)
+
 @router.get("/tourism", response_model=dict)
-async def get_tourism_geojson():
+async def get_tourism_geojson(precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION), if_none_match: Optional[str] = Header(None)):
     file_path = "geodata/Tourism.geojson"  # Đường dẫn tới file Tourism.geojson
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/json")
-    raise HTTPException(status_code=404, detail="File Tourism.geojson not found")
+    return geojson_response(file_path, precision, if_none_match)
 
 @router.get("/education", response_model=dict)
-async def get_tourism_geojson():
+async def get_tourism_geojson(precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION), if_none_match: Optional[str] = Header(None)):
     file_path = "geodata/Education.geojson"  # Đường dẫn tới file Tourism.geojson
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/json")
-    raise HTTPException(status_code=404, detail="File Education.geojson not found")
+    return geojson_response(file_path, precision, if_none_match)
 
 @router.get("/medical", response_model=dict)
-async def get_tourism_geojson():
+async def get_tourism_geojson(precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION), if_none_match: Optional[str] = Header(None)):
     file_path = "geodata/Medical.geojson"  # Đường dẫn tới file Tourism.geojson
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/json")
-    raise HTTPException(status_code=404, detail="File Medical.geojson not found")
+    return geojson_response(file_path, precision, if_none_match)
 
 @router.get("/market", response_model=dict)
-async def get_tourism_geojson():
+async def get_tourism_geojson(precision: int = Query(DEFAULT_PRECISION, ge=0, le=MAX_PRECISION), if_none_match: Optional[str] = Header(None)):
     file_path = "geodata/Market.geojson"  # Đường dẫn tới file Tourism.geojson
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/json")
-    raise HTTPException(status_code=404, detail="File Market.geojson not found")
\ No newline at end of file
+    return geojson_response(file_path, precision, if_none_match)
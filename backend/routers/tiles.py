@@ -0,0 +1,87 @@
+from fastapi import Depends, HTTPException, status, APIRouter, Query, Response, BackgroundTasks, Header
+from sqlalchemy.orm import Session
+from typing import Optional, List
+from model.features import Feature
+from model.layers import Layer
+from model.default_vector_layer import DefaultVectorLayer
+from model.connect import get_db
+from utils.utils import get_current_user, oauth2_scheme
+from utils.geometry_levels import geometry_for
+from utils.geometry_store import geometry_overlaps
+from utils.vector_tiles import MVT_MEDIA_TYPE, valid_tile, json_properties, mvt_query
+from utils.default_tiles import SEED_MAX_ZOOM, default_tile, seed_all_default_tiles
+from utils.versions import make_etag, etag_matches, etag_headers, not_modified
+
+router = APIRouter(prefix="/tiles", tags=["tiles"])
+
+# Tên thuộc tính dành riêng trong tile, không cho properties ghi đè
+RESERVED_TILE_COLUMNS = ('geom', 'id', 'name')
+
+@router.get("/layers/{layer_id}/{z}/{x}/{y}.mvt")
+async def get_layer_tile(
+    layer_id: int,
+    z: int,
+    x: int,
+    y: int,
+    properties: Optional[str] = Query(None, description="Comma separated property keys to include"),
+    if_none_match: Optional[str] = Header(None),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    current_user = await get_current_user(token)
+
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid tile coordinates")
+    layer = db.query(Layer).filter(Layer.layer_id == layer_id).first()
+    if not layer:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
+
+    keys = [key.strip() for key in (properties or '').split(',') if key.strip() and key.strip() not in RESERVED_TILE_COLUMNS]
+    headers = etag_headers(make_etag('layer-tile', layer_id, layer.version, z, x, y, keys))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    columns = [Feature.feature_name.label('name')] + [json_properties(Feature.properties)[key].astext.label(key) for key in keys]
+    # Mức geometry đơn giản hoá theo zoom của tile (đọc qua geometry_store nếu dùng chung) chỉ dùng
+    # khi cắt tile; lọc theo tile bằng geom gốc để dùng GIST index của features và geometry_store
+    stmt = mvt_query(
+        geometry_for(zoom=z), f"layer_{layer_id}", Feature.feature_id, columns, [Feature.layer_id == layer_id], z, x, y,
+        search_filter=geometry_overlaps
+    )
+    tile = db.execute(stmt).scalar()
+    return Response(content=bytes(tile) if tile else b'', media_type=MVT_MEDIA_TYPE, headers=headers)
+
+@router.get("/default-layers/{layer_id}/{z}/{x}/{y}.mvt")
+async def get_default_layer_tile(
+    layer_id: int,
+    z: int,
+    x: int,
+    y: int,
+    if_none_match: Optional[str] = Header(None),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    current_user = await get_current_user(token)
+
+    if not valid_tile(z, x, y):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Invalid tile coordinates")
+    layer = db.query(DefaultVectorLayer).filter(DefaultVectorLayer.default_layer_id == layer_id).first()
+    if not layer:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Default vector layer not found")
+
+    headers = etag_headers(make_etag('default-tile', layer_id, layer.version, z, x, y))
+    if etag_matches(if_none_match, headers["ETag"]):
+        return not_modified(headers)
+    # Đọc từ cache trên đĩa, chỉ dựng tile từ database khi chưa có
+    return Response(content=default_tile(db, layer_id, z, x, y), media_type=MVT_MEDIA_TYPE, headers=headers)
+
+@router.post("/default-layers/seed", status_code=status.HTTP_202_ACCEPTED)
+async def seed_default_layer_tiles(
+    background_tasks: BackgroundTasks,
+    layer_ids: Optional[List[int]] = Query(None),
+    max_zoom: int = Query(SEED_MAX_ZOOM, ge=0, le=SEED_MAX_ZOOM),
+    token: str = Depends(oauth2_scheme)
+):
+    current_user = await get_current_user(token)
+    # Seed chạy nền sau khi trả response; tile đã có trong cache được bỏ qua
+    background_tasks.add_task(seed_all_default_tiles, max_zoom, layer_ids)
+    return {"message": "Default tile seeding started", "layer_ids": layer_ids, "max_zoom": max_zoom}
@@ -0,0 +1,221 @@
+from fastapi import Depends, HTTPException, status, APIRouter, Request, Header
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy.orm import Session
+from pydantic import BaseModel
+from typing import Optional, List
+from model.upload_sessions import UploadSession
+from model.layers import Layer
+from model.projects import Project
+from model.connect import get_db
+from utils.utils import get_current_user, oauth2_scheme
+from utils.file_processor import PARSERS, get_extension
+from utils.chunked_upload import received_chunks, write_chunk, assemble_chunks, remove_upload
+from utils.import_jobs import IMPORT_DIR, enqueue_import_file
+from utils.versions import bump_project_versions
+import os
+import uuid
+import tempfile
+
+router = APIRouter(prefix="/uploads", tags=["uploads"])
+
+DEFAULT_CHUNK_SIZE = 8 * 1024 * 1024
+MAX_CHUNK_SIZE = 64 * 1024 * 1024
+
+class UploadInit(BaseModel):
+    file_name: str
+    total_size: int
+    chunk_size: int = DEFAULT_CHUNK_SIZE
+    sha256: Optional[str] = None
+
+class UploadFinalize(BaseModel):
+    # Thêm vào layer có sẵn (layer_id) hoặc tạo layer mới trong project_id
+    layer_id: Optional[int] = None
+    project_id: Optional[int] = None
+    name: Optional[str] = None
+    fill_color: Optional[str] = None
+    stroke_color: Optional[str] = None
+    stroke_width: Optional[int] = None
+    priority: int = 0
+
+class UploadStatusResponse(BaseModel):
+    upload_id: str
+    file_name: str
+    total_size: int
+    chunk_size: int
+    total_chunks: int
+    status: str
+    received_chunks: List[int]
+    missing_chunks: List[int]
+    job_id: Optional[int] = None
+
+def get_upload_session(db, upload_id, user_id):
+    upload = db.query(UploadSession).filter(UploadSession.upload_id == upload_id, UploadSession.user_id == user_id).first()
+    if not upload:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload not found")
+    return upload
+
+def expected_chunk_size(upload, index):
+    if index == upload.total_chunks - 1:
+        return upload.total_size - upload.chunk_size * (upload.total_chunks - 1)
+    return upload.chunk_size
+
+def upload_status(upload):
+    received = received_chunks(upload.upload_id) if upload.status == "uploading" else list(range(upload.total_chunks))
+    received_set = set(received)
+    return {
+        "upload_id": upload.upload_id,
+        "file_name": upload.file_name,
+        "total_size": upload.total_size,
+        "chunk_size": upload.chunk_size,
+        "total_chunks": upload.total_chunks,
+        "status": upload.status,
+        "received_chunks": received,
+        "missing_chunks": [i for i in range(upload.total_chunks) if i not in received_set],
+        "job_id": upload.job_id
+    }
+
+@router.post("/", response_model=UploadStatusResponse)
+async def init_upload(upload: UploadInit, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    current_user = await get_current_user(token)
+    user_id = current_user.get("user_id")
+
+    extension = get_extension(upload.file_name)
+    if extension not in PARSERS:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Unsupported file format")
+    if upload.total_size <= 0 or not 0 < upload.chunk_size <= MAX_CHUNK_SIZE:
+        raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="Invalid total_size or chunk_size")
+
+    db_upload = UploadSession(
+        upload_id=str(uuid.uuid4()),
+        user_id=user_id,
+        file_name=upload.file_name,
+        extension=extension,
+        total_size=upload.total_size,
+        chunk_size=upload.chunk_size,
+        total_chunks=(upload.total_size + upload.chunk_size - 1) // upload.chunk_size,
+        sha256=upload.sha256.lower() if upload.sha256 else None,
+        status="uploading",
+    )
+    db.add(db_upload)
+    db.commit()
+    db.refresh(db_upload)
+    return upload_status(db_upload)
+
+@router.put("/{upload_id}/chunks/{index}")
+async def append_chunk(
+    upload_id: str,
+    index: int,
+    request: Request,
+    x_chunk_sha256: str = Header(...),
+    token: str = Depends(oauth2_scheme),
+    db: Session = Depends(get_db)
+):
+    current_user = await get_current_user(token)
+    user_id = current_user.get("user_id")
+
+    upload = get_upload_session(db, upload_id, user_id)
+    if upload.status != "uploading":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload already finalized")
+    if not 0 <= index < upload.total_chunks:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Chunk index out of range")
+
+    try:
+        size = await write_chunk(upload_id, index, request.stream(), x_chunk_sha256, expected_chunk_size(upload, index))
+    except ValueError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    return {"upload_id": upload_id, "index": index, "size": size}
+
+@router.get("/{upload_id}", response_model=UploadStatusResponse)
+async def get_upload_status(upload_id: str, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    current_user = await get_current_user(token)
+    user_id = current_user.get("user_id")
+
+    upload = get_upload_session(db, upload_id, user_id)
+    return upload_status(upload)
+
+@router.post("/{upload_id}/finalize")
+async def finalize_upload(upload_id: str, target: UploadFinalize, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
+    current_user = await get_current_user(token)
+    user_id = current_user.get("user_id")
+
+    upload = get_upload_session(db, upload_id, user_id)
+    if upload.status != "uploading":
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload already finalized")
+    missing = upload_status(upload)["missing_chunks"]
+    if missing:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Missing chunks: {missing}")
+
+    if target.layer_id:
+        layer = db.query(Layer).join(Project).filter(Layer.layer_id == target.layer_id, Project.user_id == user_id).first()
+        if not layer:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Layer not found")
+    else:
+        if not target.project_id or not target.name:
+            raise HTTPException(status_code=status.HTTP_422_UNPROCESSABLE_ENTITY, detail="project_id and name are required to create a layer")
+        project = db.query(Project).filter(Project.project_id == target.project_id, Project.user_id == user_id).first()
+        if not project:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Project not found")
+
+    # Giành upload bằng một câu UPDATE có điều kiện: chỉ một request finalize đi tiếp,
+    # các request đồng thời khác nhận 409 thay vì ghép và tạo job lần nữa
+    claimed = db.query(UploadSession).filter(
+        UploadSession.upload_id == upload_id, UploadSession.status == "uploading"
+    ).update({UploadSession.status: "assembling"}, synchronize_session=False)
+    db.commit()
+    if not claimed:
+        raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail="Upload already finalized")
+
+    created_layer = False
+    file_path = None
+    try:
+        if not target.layer_id:
+            layer = Layer(
+                project_id=target.project_id,
+                layer_name=target.name,
+                fill=target.fill_color,
+                stroke=target.stroke_color,
+                stroke_width=target.stroke_width,
+                z_index=target.priority,
+                layer_type='L001',
+            )
+            db.add(layer)
+            bump_project_versions(db, [target.project_id])
+            db.commit()
+            db.refresh(layer)
+            created_layer = True
+
+        # Ghép các chunk thành một file trong IMPORT_DIR rồi giao cho import job; việc đọc/ghi
+        # file (có thể hàng GB) chạy trong threadpool để không chặn event loop
+        os.makedirs(IMPORT_DIR, exist_ok=True)
+        fd, file_path = tempfile.mkstemp(suffix='.' + upload.extension, dir=IMPORT_DIR)
+        os.close(fd)
+        file_sha256 = await run_in_threadpool(assemble_chunks, upload_id, upload.total_chunks, file_path)
+        if os.path.getsize(file_path) != upload.total_size or (upload.sha256 and file_sha256 != upload.sha256):
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Assembled file does not match the declared size or checksum")
+
+        job = enqueue_import_file(db, user_id, layer.layer_id, file_path, upload.file_name, upload.extension, delete_layer_on_failure=created_layer)
+    except Exception:
+        # Trả upload về trạng thái uploading để client gửi lại chunk hoặc finalize lại
+        db.rollback()
+        if file_path and os.path.exists(file_path):
+            os.remove(file_path)
+        if created_layer:
+            bump_project_versions(db, [layer.project_id])
+            db.delete(layer)
+        db.query(UploadSession).filter(UploadSession.upload_id == upload_id).update(
+            {UploadSession.status: "uploading"}, synchronize_session=False
+        )
+        db.commit()
+        raise
+
+    upload.status = "finalized"
+    upload.job_id = job.job_id
+    db.commit()
+    remove_upload(upload_id)
+    return {
+        "message": "Upload finalized, import job queued",
+        "upload_id": upload_id,
+        "job_id": job.job_id,
+        "layer_id": layer.layer_id,
+        "sha256": file_sha256
+    }
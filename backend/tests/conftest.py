@@ -0,0 +1,9 @@
+import os
+import sys
+
+# Chạy từ thư mục backend như main.py; test không cần kết nối database thật nhưng
+# model/connect.py cần đủ biến môi trường để tạo engine
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+for name in ('DB_USER', 'DB_PASSWORD', 'DB_HOST', 'DB_NAME'):
+    os.environ.setdefault(name, 'test')
+os.environ.setdefault('DB_PORT', '5432')
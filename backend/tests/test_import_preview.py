@@ -0,0 +1,43 @@
+import io
+import json
+import numpy as np
+import pytest
+from utils import import_preview
+from utils.import_preview import preview_import, estimate_geojson_features
+from utils.file_processor import get_parser
+
+# Sai số cho phép của estimated_count khi file GeoJSON lớn hơn phần được đọc để ước lượng
+ESTIMATE_TOLERANCE = 0.02
+
+def geojson_file(count, seed=0):
+    # Polygon có số đỉnh thay đổi mạnh (vài chục tới vài nghìn byte mỗi feature)
+    rng = np.random.default_rng(seed)
+    features = []
+    for index in range(count):
+        vertices = int(rng.integers(4, 120))
+        angles = np.linspace(0, 2 * np.pi, vertices, endpoint=False)
+        center = rng.uniform([102, 8.5], [109.5, 23.4])
+        ring = (center + 0.01 * np.column_stack([np.cos(angles), np.sin(angles)])).round(6).tolist()
+        features.append({
+            "type": "Feature",
+            "properties": {"VARNAME_1": f"feature {index}", "note": "x" * int(rng.integers(0, 400))},
+            "geometry": {"type": "Polygon", "coordinates": [ring + [ring[0]]]},
+        })
+    return io.BytesIO(json.dumps({"type": "FeatureCollection", "features": features}).encode())
+
+@pytest.mark.parametrize("preview_size", [10, 50, 200])
+def test_geojson_estimate_within_tolerance(monkeypatch, preview_size):
+    # Ước lượng từ 64 KiB đầu của file khoảng 3 MiB (nhiều khối đọc)
+    monkeypatch.setattr(import_preview, 'GEOJSON_SAMPLE_BYTES', 64 * 1024)
+    file_like = geojson_file(2000)
+    preview = preview_import(file_like, 'geojson', get_parser('geojson'), 'head', preview_size)
+    assert not preview["count_exact"]
+    assert abs(preview["estimated_count"] - 2000) <= 2000 * ESTIMATE_TOLERANCE
+
+def test_geojson_estimate_exact_when_fully_read():
+    file_like = geojson_file(300)
+    assert estimate_geojson_features(file_like) == (300, True)
+
+def test_geojson_estimate_unknown_for_truncated_file():
+    file_like = io.BytesIO(b'{"type": "FeatureCollection", "features": [{"type": "Feature", "geometry": null')
+    assert estimate_geojson_features(file_like) == (None, False)
@@ -0,0 +1,173 @@
+import os
+import json
+import time
+import logging
+import numpy as np
+import shapely
+from shapely.geometry import shape
+from sqlalchemy import insert, select, literal, any_, Integer
+from sqlalchemy.dialects.postgresql import ARRAY
+from geoalchemy2.functions import ST_AsGeoJSON
+from model.features import Feature
+from utils.file_processor import FeatureBatch
+from utils.reprojection import reproject_batches, TARGET_CRS
+from utils.geometry_validation import new_validation_report, validate_batches
+from utils.precision import snap_batches
+from utils.geometry_levels import simplify_levels
+from utils.geometry_store import resolved_geometry, intern_geometries
+
+logger = logging.getLogger(__name__)
+
+# Số feature được gom lại trong một câu INSERT nhiều dòng
+INSERT_BATCH_SIZE = 1000
+# Upload lớn hơn ngưỡng này mặc định chỉ trả về số lượng và id, không giữ lại các dòng đã chèn
+RETURN_FEATURES_MAX_BYTES = int(os.getenv("RETURN_FEATURES_MAX_BYTES", str(10 * 1024 * 1024)))
+
+def get_feature_name(properties, extension):
+    if extension == 'kmz':
+        return properties.get('name', 'COUNTRY')
+    return properties.get('VARNAME_1', 'COUNTRY')
+
+def features_to_batch(batch, extension):
+    geometries = np.empty(len(batch), dtype=object)
+    geometries[:] = [shape(f['geometry']) if isinstance(f['geometry'], dict) else f['geometry'] for f in batch]
+    return FeatureBatch(
+        names=[get_feature_name(f['properties'], extension) for f in batch],
+        properties=[json.dumps(f['properties']) for f in batch],
+        geometries=geometries,
+        crs=batch[0].get('crs'),
+    )
+
+def iter_feature_batches(features_data, extension, batch_size=INSERT_BATCH_SIZE, report=None):
+    # Parser có thể trả về từng feature (dict) hoặc các FeatureBatch đã giải mã theo cột.
+    # Feature parser không đọc được (có 'error') bị bỏ qua và đếm vào report['malformed']
+    batch = []
+    for item in features_data:
+        if isinstance(item, dict) and 'error' in item:
+            if report is not None:
+                report['malformed'] += 1
+                report['reasons'][item['error']] = report['reasons'].get(item['error'], 0) + 1
+            continue
+        if isinstance(item, FeatureBatch):
+            if batch:
+                yield features_to_batch(batch, extension)
+                batch = []
+            yield item
+            continue
+        batch.append(item)
+        if len(batch) >= batch_size:
+            yield features_to_batch(batch, extension)
+            batch = []
+    if batch:
+        yield features_to_batch(batch, extension)
+
+def to_ewkb(geometries, srid):
+    return shapely.to_wkb(shapely.set_srid(geometries, srid), hex=True, include_srid=True)
+
+def encode_feature_batch(layer_id, feature_batch, srid=4326):
+    # Chuyển cả lô geometry (và các mức đơn giản hoá) sang EWKB hex bằng các lời gọi shapely theo mảng
+    ewkb = to_ewkb(feature_batch.geometries, srid)
+    levels = {column: to_ewkb(geometries, srid) for column, geometries in simplify_levels(feature_batch.geometries).items()}
+    rows = [
+        {
+            'layer_id': layer_id,
+            'feature_name': name,
+            'properties': properties,
+            'geom': geom,
+        }
+        for name, properties, geom in zip(feature_batch.names, feature_batch.properties, ewkb)
+    ]
+    for column, values in levels.items():
+        for row, value in zip(rows, values):
+            row[column] = value
+    return rows
+
+def feature_insert_statement(return_rows=True):
+    returning = (Feature.feature_id, Feature.layer_id, Feature.feature_name, Feature.properties, ST_AsGeoJSON(Feature.geom).label('geom')) if return_rows else (Feature.feature_id,)
+    return insert(Feature.__table__).returning(*returning, sort_by_parameter_order=True)
+
+def upload_size(upload_file):
+    size = getattr(upload_file, 'size', None)
+    if size is None:
+        size = upload_file.file.seek(0, os.SEEK_END)
+        upload_file.file.seek(0)
+    return size
+
+def should_return_features(requested, upload_file):
+    # return_features không gửi lên: chỉ trả lại feature cho file nhỏ
+    if requested is not None:
+        return requested
+    return upload_size(upload_file) <= RETURN_FEATURES_MAX_BYTES
+
+def bulk_insert_features(db, layer_id, features_data, extension, batch_size=INSERT_BATCH_SIZE, on_progress=None, return_rows=True, return_ids=False):
+    # Chèn feature theo lô bằng INSERT ... RETURNING nhiều dòng.
+    # Không commit ở đây: mọi lô nằm trong cùng transaction, router commit một lần.
+    # return_rows=False: mỗi lô được bỏ đi sau khi chèn, chỉ giữ feature_id (return_ids=True)
+    # hoặc không giữ gì (job chạy nền chỉ cần số lượng)
+    stmt = feature_insert_statement(return_rows)
+    started = time.perf_counter()
+    inserted = []
+    inserted_count = 0
+    stage_stats = {}
+    validation_report = new_validation_report()
+    feature_batches = reproject_batches(iter_feature_batches(features_data, extension, batch_size, validation_report), stage_stats)
+    # Làm tròn toạ độ trước khi kiểm tra để lỗi do làm tròn cũng được sửa (STORAGE_PRECISION)
+    feature_batches = validate_batches(snap_batches(feature_batches), validation_report)
+    for feature_batch in feature_batches:
+        rows = encode_feature_batch(layer_id, feature_batch)
+        for start in range(0, len(rows), batch_size):
+            result = db.execute(stmt, rows[start:start + batch_size]).all()
+            inserted_count += len(result)
+            if return_rows:
+                inserted.extend(result)
+            elif return_ids:
+                inserted.extend(row.feature_id for row in result)
+            if on_progress:
+                on_progress(inserted_count, time.perf_counter() - started)
+    elapsed = time.perf_counter() - started
+    stats = {
+        'inserted': inserted_count,
+        'seconds': round(elapsed, 3),
+        'features_per_second': round(inserted_count / elapsed, 1) if elapsed > 0 else None,
+        'source_crs': stage_stats.get('source_crs', TARGET_CRS),
+        'reproject_seconds': round(stage_stats.get('reproject_seconds', 0), 3),
+        'validation': dict(validation_report, seconds=round(validation_report['seconds'], 3)),
+    }
+    logger.info("Layer %s: inserted %d features in %.3fs (%s features/s)", layer_id, stats['inserted'], elapsed, stats['features_per_second'])
+    return inserted, stats
+
+def clone_features(db, layer_id, *criteria):
+    # Sao chép các feature thoả criteria sang layer_id bằng một câu INSERT ... SELECT chạy
+    # hoàn toàn trong PostgreSQL. Geometry được đưa vào geometry_store trước nên bản sao chỉ
+    # chép geom_hash. Không commit; trả về feature_id mới theo thứ tự feature nguồn.
+    intern_geometries(db, *criteria)
+    source = select(
+        literal(layer_id), Feature.feature_name, Feature.properties, Feature.geom_hash
+    ).where(*criteria).order_by(Feature.feature_id)
+    stmt = insert(Feature.__table__).from_select(
+        ['layer_id', 'feature_name', 'properties', 'geom_hash'], source
+    ).returning(Feature.feature_id)
+    return db.execute(stmt).scalars().all()
+
+def feature_ids_filter(feature_ids):
+    # Một tham số mảng duy nhất (= ANY(%s)) thay vì IN với hàng trăm nghìn tham số
+    return Feature.feature_id == any_(literal(list(feature_ids), ARRAY(Integer)))
+
+def query_feature_rows(db, *criteria):
+    # Cùng dạng dòng với RETURNING của bulk_insert_features, geometry đọc qua geometry_store nếu dùng chung
+    return db.query(
+        Feature.feature_id, Feature.layer_id, Feature.feature_name, Feature.properties,
+        ST_AsGeoJSON(resolved_geometry()).label('geom')
+    ).filter(*criteria).order_by(Feature.feature_id).all()
+
+def serialize_inserted_rows(rows):
+    return [
+        {
+            "feature_id": row.feature_id,
+            "layer_id": row.layer_id,
+            "name": row.feature_name,
+            "properties": row.properties,
+            "geom": json.loads(row.geom)
+        }
+        for row in rows
+    ]
@@ -0,0 +1,94 @@
+import os
+import time
+import shutil
+import hashlib
+import tempfile
+from datetime import timedelta
+from fastapi.concurrency import run_in_threadpool
+from sqlalchemy import func
+from model.upload_sessions import UploadSession
+
+# Thư mục chứa các chunk của những upload đang dở
+UPLOAD_DIR = os.getenv("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "gis_uploads"))
+COPY_BUFFER_SIZE = 1024 * 1024
+# Upload chưa finalize mà không nhận chunk nào trong khoảng này bị xoá bởi job dọn dẹp hằng ngày
+UPLOAD_SESSION_TTL = timedelta(days=int(os.getenv("UPLOAD_SESSION_TTL_DAYS", "2")))
+
+def upload_dir(upload_id):
+    return os.path.join(UPLOAD_DIR, upload_id)
+
+def chunk_path(upload_id, index):
+    return os.path.join(upload_dir(upload_id), f"{index:06d}.part")
+
+def received_chunks(upload_id):
+    directory = upload_dir(upload_id)
+    if not os.path.isdir(directory):
+        return []
+    return sorted(int(name.split('.')[0]) for name in os.listdir(directory) if name.endswith('.part'))
+
+async def write_chunk(upload_id, index, stream, expected_sha256, expected_size):
+    # Ghi chunk ra file tạm trong lúc băm; chỉ đổi tên thành .part khi hash khớp,
+    # nên một chunk bị đứt giữa chừng không bao giờ được tính là đã nhận.
+    # Việc ghi đĩa chạy trong threadpool để không chặn event loop
+    os.makedirs(upload_dir(upload_id), exist_ok=True)
+    digest = hashlib.sha256()
+    size = 0
+    fd, tmp_path = tempfile.mkstemp(suffix='.tmp', dir=upload_dir(upload_id))
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            async for data in stream:
+                size += len(data)
+                if size > expected_size:
+                    raise ValueError(f"Chunk {index} is larger than {expected_size} bytes")
+                digest.update(data)
+                await run_in_threadpool(out.write, data)
+        if size != expected_size:
+            raise ValueError(f"Chunk {index} must be {expected_size} bytes, got {size}")
+        if digest.hexdigest() != expected_sha256.lower():
+            raise ValueError("Chunk checksum mismatch")
+        os.replace(tmp_path, chunk_path(upload_id, index))
+        return size
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+def assemble_chunks(upload_id, total_chunks, dest_path):
+    # Nối các chunk theo thứ tự bằng copy theo luồng, trả về sha256 của cả file
+    digest = hashlib.sha256()
+    with open(dest_path, 'wb') as out:
+        for index in range(total_chunks):
+            with open(chunk_path(upload_id, index), 'rb') as chunk:
+                while True:
+                    data = chunk.read(COPY_BUFFER_SIZE)
+                    if not data:
+                        break
+                    digest.update(data)
+                    out.write(data)
+    return digest.hexdigest()
+
+def remove_upload(upload_id):
+    shutil.rmtree(upload_dir(upload_id), ignore_errors=True)
+
+def expire_upload_sessions(db):
+    # Xoá các upload chưa finalize đã quá UPLOAD_SESSION_TTL (theo updated_at của session và lần
+    # nhận chunk cuối) cùng thư mục chunk, và thư mục chunk không còn session nào. Không commit.
+    expired = 0
+    cutoff = time.time() - UPLOAD_SESSION_TTL.total_seconds()
+    candidates = db.query(UploadSession).filter(
+        UploadSession.status != "finalized",
+        UploadSession.updated_at < func.now() - UPLOAD_SESSION_TTL
+    ).all()
+    for upload in candidates:
+        directory = upload_dir(upload.upload_id)
+        if os.path.isdir(directory) and os.path.getmtime(directory) >= cutoff:
+            continue
+        remove_upload(upload.upload_id)
+        db.delete(upload)
+        expired += 1
+    if os.path.isdir(UPLOAD_DIR):
+        names = [name for name in os.listdir(UPLOAD_DIR) if os.path.getmtime(upload_dir(name)) < cutoff]
+        known = {upload_id for (upload_id,) in db.query(UploadSession.upload_id).filter(UploadSession.upload_id.in_(names))} if names else set()
+        for name in names:
+            if name not in known:
+                remove_upload(name)
+    return expired
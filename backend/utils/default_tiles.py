@@ -0,0 +1,55 @@
+from sqlalchemy import func
+from model.connect import SessionLocal
+from model.default_feature import DefaultFeature
+from model.default_vector_layer import DefaultVectorLayer
+from utils.geometry_levels import pixel_size
+from utils.vector_tiles import MVT_EXTENT, mvt_query
+from utils.tile_cache import cached_tile, invalidate_tiles
+
+# Tile ranh giới hành chính mặc định: dữ liệu gần như không đổi nên được cache trên đĩa,
+# seed sẵn tới zoom 12 và chỉ bị xoá khi default_feature của layer thay đổi
+DEFAULT_TILE_NAMESPACE = "default"
+SEED_MAX_ZOOM = 12
+DEFAULT_TILE_COLUMNS = ('GID_1', 'NAME_1', 'VARNAME_1', 'ENGTYPE_1', 'HASC_1')
+
+def render_default_tile(db, layer_id, z, x, y):
+    # Đơn giản hoá theo một đơn vị lưới tile trước khi cắt, lọc bằng index trên geom gốc
+    geometry = func.ST_Simplify(DefaultFeature.geom, pixel_size(z) * 256 / MVT_EXTENT, True)
+    columns = [getattr(DefaultFeature, column) for column in DEFAULT_TILE_COLUMNS]
+    stmt = mvt_query(
+        geometry, f"default_{layer_id}", DefaultFeature.id, columns,
+        [DefaultFeature.layer_id == layer_id], z, x, y, search_geometry=DefaultFeature.geom
+    )
+    tile = db.execute(stmt).scalar()
+    return bytes(tile) if tile else b''
+
+def default_tile(db, layer_id, z, x, y):
+    return cached_tile(DEFAULT_TILE_NAMESPACE, layer_id, z, x, y, lambda: render_default_tile(db, layer_id, z, x, y))
+
+def invalidate_default_tiles(*layer_ids):
+    for layer_id in set(layer_ids):
+        if layer_id is not None:
+            invalidate_tiles(DEFAULT_TILE_NAMESPACE, layer_id)
+
+def seed_default_tiles(db, layer_id, max_zoom=SEED_MAX_ZOOM):
+    # Đi theo cây tứ phân từ tile 0/0/0, chỉ xuống tile con của tile có dữ liệu
+    # (biển và nước ngoài không sinh hàng nghìn tile rỗng). Trả về số tile đã duyệt.
+    pending = [(0, 0, 0)]
+    seeded = 0
+    while pending:
+        z, x, y = pending.pop()
+        tile = default_tile(db, layer_id, z, x, y)
+        seeded += 1
+        if tile and z < max_zoom:
+            pending.extend((z + 1, 2 * x + dx, 2 * y + dy) for dx in (0, 1) for dy in (0, 1))
+    return seeded
+
+def seed_all_default_tiles(max_zoom=SEED_MAX_ZOOM, layer_ids=None):
+    # Chạy nền với session riêng
+    db = SessionLocal()
+    try:
+        if not layer_ids:
+            layer_ids = [layer_id for (layer_id,) in db.query(DefaultVectorLayer.default_layer_id).all()]
+        return {layer_id: seed_default_tiles(db, layer_id, max_zoom) for layer_id in layer_ids}
+    finally:
+        db.close()
@@ -0,0 +1,135 @@
+import io
+import json
+import pyarrow as pa
+from fastapi import Response
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func, select, case, cast, literal, literal_column, Text, Integer
+from model.connect import SessionLocal
+from model.features import Feature
+from utils.feature_json import feature_properties
+
+# Định dạng trả về của các endpoint đọc layer, chọn theo header Accept:
+# GeoJSON (mặc định), FlatGeobuf (có spatial index, client đọc dần được) và GeoArrow
+# (Arrow IPC stream, geometry mã hoá WKB theo geoarrow.wkb)
+GEOJSON_MEDIA_TYPE = "application/json"
+FLATGEOBUF_MEDIA_TYPE = "application/flatgeobuf"
+ARROW_STREAM_MEDIA_TYPE = "application/vnd.apache.arrow.stream"
+FEATURE_MEDIA_TYPES = {
+    GEOJSON_MEDIA_TYPE: 'geojson',
+    "application/geo+json": 'geojson',
+    FLATGEOBUF_MEDIA_TYPE: 'flatgeobuf',
+    ARROW_STREAM_MEDIA_TYPE: 'arrow',
+}
+# Số dòng mỗi lần đọc từ cursor phía server và mỗi record batch Arrow
+ARROW_BATCH_SIZE = 10000
+
+GEOARROW_FIELD_METADATA = {
+    b'ARROW:extension:name': b'geoarrow.wkb',
+    b'ARROW:extension:metadata': json.dumps({"crs": "OGC:CRS84", "crs_type": "authority_code"}).encode(),
+}
+ARROW_SCHEMA = pa.schema([
+    pa.field('feature_id', pa.int32()),
+    pa.field('layer_id', pa.int32()),
+    pa.field('name', pa.string()),
+    pa.field('properties', pa.string()),
+    pa.field('geometry', pa.binary(), metadata=GEOARROW_FIELD_METADATA),
+])
+
+def negotiate_format(accept):
+    # Chọn định dạng có q cao nhất trong Accept (bằng nhau thì theo thứ tự xuất hiện)
+    best, best_quality = 'geojson', 0.0
+    for item in (accept or '').split(','):
+        media_type, *params = [part.strip() for part in item.split(';')]
+        quality = 1.0
+        for param in params:
+            if param.startswith('q='):
+                try:
+                    quality = float(param[2:])
+                except ValueError:
+                    quality = 0.0
+        if media_type.lower() in FEATURE_MEDIA_TYPES and quality > best_quality:
+            best, best_quality = FEATURE_MEDIA_TYPES[media_type.lower()], quality
+    return best
+
+def feature_columns():
+    # properties là chuỗi JSON vì các feature trong layer không có chung bộ thuộc tính
+    return (
+        Feature.feature_id,
+        Feature.layer_id,
+        Feature.feature_name.label('name'),
+        cast(feature_properties(), Text).label('properties'),
+    )
+
+def flatgeobuf_query(geometry, criteria, limit=None):
+    # ST_AsFlatGeobuf dựng cả file kèm spatial index trong PostGIS. Như grouped_features_query:
+    # với limit lấy limit + 1 dòng, đóng gói limit dòng đầu và trả về feature_id cuối làm cursor
+    # nếu còn trang sau. Kết quả: (data, next_cursor).
+    page = select(*feature_columns(), geometry.label('geom')).where(*criteria).order_by(Feature.feature_id)
+    if not limit:
+        rows = page.subquery('fgb')
+        return select(func.ST_AsFlatGeobuf(literal_column('fgb'), True, 'geom'), literal(None, Integer)).select_from(rows)
+    page = page.add_columns(func.row_number().over(order_by=Feature.feature_id).label('position')).limit(limit + 1).cte('page')
+    # Cột position không được đưa vào file
+    rows = select(*[column for column in page.c if column.key != 'position']).where(page.c.position <= limit).subquery('fgb')
+    data = select(func.ST_AsFlatGeobuf(literal_column('fgb'), True, 'geom')).select_from(rows).scalar_subquery()
+    next_cursor = select(
+        case((func.count() > limit, func.max(page.c.feature_id).filter(page.c.position <= limit)))
+    ).select_from(page).scalar_subquery()
+    return select(data, next_cursor)
+
+def arrow_query(geometry, criteria, limit=None):
+    stmt = select(*feature_columns(), func.ST_AsBinary(geometry).label('geometry')).where(*criteria).order_by(Feature.feature_id)
+    return stmt.limit(limit) if limit else stmt
+
+def arrow_stream(stmt, batch_size=ARROW_BATCH_SIZE):
+    # Đọc bằng cursor phía server theo từng lô, mỗi lô thành một record batch được gửi ngay.
+    # Dùng session riêng vì generator chạy sau khi endpoint đã trả về.
+    db = SessionLocal()
+    sink = io.BytesIO()
+    try:
+        writer = pa.ipc.new_stream(sink, ARROW_SCHEMA)
+        result = db.execute(stmt, execution_options={'stream_results': True, 'max_row_buffer': batch_size})
+        for rows in result.partitions(batch_size):
+            feature_ids, layer_ids, names, properties, geometries = zip(*rows)
+            writer.write_batch(pa.record_batch([
+                pa.array(feature_ids, pa.int32()),
+                pa.array(layer_ids, pa.int32()),
+                pa.array(names, pa.string()),
+                pa.array(properties, pa.string()),
+                pa.array([bytes(geometry) if geometry is not None else None for geometry in geometries], pa.binary()),
+            ], schema=ARROW_SCHEMA))
+            yield sink.getvalue()
+            sink.seek(0)
+            sink.truncate()
+        writer.close()
+        yield sink.getvalue()
+    finally:
+        db.close()
+
+def next_page_cursor(db, criteria, limit):
+    # Luồng Arrow cần cursor trong header trước khi gửi dòng đầu: đọc limit + 1 feature_id
+    # (chỉ index khoá chính), còn dòng thừa thì feature_id thứ limit là cursor
+    ids = db.execute(
+        select(Feature.feature_id).where(*criteria).order_by(Feature.feature_id).limit(limit + 1)
+    ).scalars().all()
+    return ids[limit - 1] if len(ids) > limit else None
+
+def flatgeobuf_page(db, geometry, criteria, limit=None):
+    data, next_cursor = db.execute(flatgeobuf_query(geometry, criteria, limit)).one()
+    return (bytes(data) if data else b''), next_cursor
+
+def flatgeobuf_body(db, geometry, criteria):
+    return flatgeobuf_page(db, geometry, criteria)[0]
+
+def binary_features_response(db, feature_format, geometry, criteria, limit=None, headers=None):
+    # Với limit: header X-Next-Cursor là feature_id cuối của trang nếu còn trang sau
+    headers = dict(headers or {})
+    if feature_format == 'flatgeobuf':
+        content, next_cursor = flatgeobuf_page(db, geometry, criteria, limit)
+    else:
+        next_cursor = next_page_cursor(db, criteria, limit) if limit else None
+    if next_cursor is not None:
+        headers["X-Next-Cursor"] = str(next_cursor)
+    if feature_format == 'flatgeobuf':
+        return Response(content=content, media_type=FLATGEOBUF_MEDIA_TYPE, headers=headers)
+    return StreamingResponse(arrow_stream(arrow_query(geometry, criteria, limit)), media_type=ARROW_STREAM_MEDIA_TYPE, headers=headers)
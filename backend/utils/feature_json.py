@@ -0,0 +1,106 @@
+from sqlalchemy import func, select, case, cast, literal, true, Text, Integer
+from sqlalchemy.dialects.postgresql import JSON, JSONB, ARRAY, aggregate_order_by
+from model.features import Feature
+from model.layers import Layer
+from utils.vector_tiles import json_properties
+from utils.precision import DEFAULT_PRECISION
+
+# JSON của các endpoint đọc feature được dựng ngay trong PostgreSQL (json_build_object,
+# json_agg, ST_AsGeoJSON) và trả về dạng text để đi thẳng ra response, không tạo object Python
+
+def feature_properties(column=Feature.properties):
+    # NULL, JSON null hay chuỗi "null" đều thành {}
+    return func.coalesce(func.nullif(json_properties(column), cast('null', JSONB)), cast('{}', JSONB))
+
+def geojson_geometry(geometry, precision=DEFAULT_PRECISION):
+    return cast(func.ST_AsGeoJSON(geometry, precision), JSON)
+
+def feature_object(geometry, precision=DEFAULT_PRECISION):
+    return func.json_build_object(
+        'feature_id', Feature.feature_id,
+        'feature_name', Feature.feature_name,
+        'layer_id', Feature.layer_id,
+        'properties', feature_properties(),
+        'geom', geojson_geometry(geometry, precision),
+        'feature_fill', Feature.feature_fill,
+        'feature_stroke', Feature.feature_stroke,
+        'created_at', Feature.created_at,
+        'updated_at', Feature.updated_at,
+    )
+
+def layer_object(layer=Layer):
+    return func.json_build_object(
+        'id', layer.layer_id,
+        'name', layer.layer_name,
+        'fill', layer.fill,
+        'stroke', layer.stroke,
+        'stroke_width', layer.stroke_width,
+        'priority', layer.z_index,
+    )
+
+def grouped_features_query(layer_ids, geometry, criteria=(), limit=None, precision=DEFAULT_PRECISION):
+    # [{"layer": {...}, "features": [...]}, ...] theo thứ tự layer_ids trong một câu SQL.
+    # Với limit: lấy limit + 1 feature theo feature_id, trả về limit feature đầu và
+    # feature_id cuối làm cursor nếu còn trang sau. Kết quả: (body, next_cursor).
+    page = select(
+        Feature.feature_id,
+        Feature.layer_id,
+        func.json_build_object(
+            'feature_id', Feature.feature_id,
+            'layer_id', Feature.layer_id,
+            'name', func.coalesce(func.nullif(Feature.feature_name, ''), 'Unnamed'),
+            'properties', feature_properties(),
+            'geom', geojson_geometry(geometry, precision),
+        ).label('feature'),
+        func.row_number().over(order_by=Feature.feature_id).label('position'),
+    ).where(Feature.layer_id.in_(layer_ids), *criteria).order_by(Feature.feature_id)
+    if limit:
+        page = page.limit(limit + 1)
+    page = page.cte('page')
+    shown = page.c.position <= limit if limit else true()
+
+    layer_features = select(
+        page.c.layer_id,
+        func.json_agg(aggregate_order_by(page.c.feature, page.c.feature_id)).label('features'),
+    ).where(shown).group_by(page.c.layer_id).subquery('layer_features')
+    groups = select(
+        func.json_agg(aggregate_order_by(
+            func.json_build_object(
+                'layer', layer_object(),
+                'features', func.coalesce(layer_features.c.features, cast('[]', JSON)),
+            ),
+            func.array_position(literal(list(layer_ids), ARRAY(Integer)), Layer.layer_id),
+        ))
+    ).select_from(
+        Layer.__table__.outerjoin(layer_features, layer_features.c.layer_id == Layer.layer_id)
+    ).where(Layer.layer_id.in_(layer_ids)).scalar_subquery()
+
+    next_cursor = select(
+        case((func.count() > limit, func.max(page.c.feature_id).filter(shown)))
+    ).select_from(page).scalar_subquery() if limit else literal(None, Integer)
+    return select(
+        cast(func.coalesce(groups, cast('[]', JSON)), Text).label('body'),
+        next_cursor.label('next_cursor'),
+    )
+
+def layer_group_body(db, layer_id, geometry, precision=DEFAULT_PRECISION):
+    # Phần tử {"layer": ..., "features": [...]} của một layer (bỏ cặp [] của mảng một phần tử),
+    # để /features/by-ids cache và ghép theo từng layer
+    body, _ = db.execute(grouped_features_query([layer_id], geometry, precision=precision)).one()
+    return body[1:-1].encode()
+
+def feature_query(geometry, *criteria, precision=DEFAULT_PRECISION):
+    return select(cast(feature_object(geometry, precision), Text)).where(*criteria)
+
+def feature_collection_query(geometry, criteria, precision=DEFAULT_PRECISION):
+    # FeatureCollection GeoJSON chuẩn của một layer; tên feature nằm trong properties.name
+    feature = func.json_build_object(
+        'type', 'Feature',
+        'id', Feature.feature_id,
+        'properties', feature_properties().op('||')(func.jsonb_build_object('name', Feature.feature_name)),
+        'geometry', geojson_geometry(geometry, precision),
+    )
+    return select(cast(func.json_build_object(
+        'type', 'FeatureCollection',
+        'features', func.coalesce(func.json_agg(aggregate_order_by(feature, Feature.feature_id)), cast('[]', JSON)),
+    ), Text)).where(*criteria)
@@ -1,130 +1,340 @@
-import geopandas as gpd
 from zipfile import ZipFile
-from io import BytesIO
-from pykml import parser as kml_parser
-from shapely.geometry import Point, LineString, Polygon, MultiPoint, MultiLineString, MultiPolygon, shape
+from contextlib import contextmanager
+from lxml import etree
+from shapely.geometry import shape
 import json
 import os
 import tempfile
 import shutil
-from geojson import loads as geojson_loads
+import ijson
+import re
+import numpy as np
+import shapely
+import pyarrow as pa
+import pyarrow.parquet as pq
+from pyproj import CRS
+from typing import NamedTuple, Optional
+from pyogrio import list_layers
+from pyogrio.raw import open_arrow
+
+# Số dòng mỗi RecordBatch khi đọc GPKG/SHP qua Arrow
+ARROW_BATCH_SIZE = 10000
+COPY_BUFFER_SIZE = 1024 * 1024
+
+KML_GEOMETRY_TAGS = ('Point', 'LineString', 'LinearRing', 'Polygon', 'MultiGeometry')
+# Các encoding GeoArrow gốc của GeoParquet: (loại geometry shapely, số tầng offset)
+GEOARROW_ENCODINGS = {
+    'point': (shapely.GeometryType.POINT, 0),
+    'linestring': (shapely.GeometryType.LINESTRING, 1),
+    'polygon': (shapely.GeometryType.POLYGON, 2),
+    'multipoint': (shapely.GeometryType.MULTIPOINT, 1),
+    'multilinestring': (shapely.GeometryType.MULTILINESTRING, 2),
+    'multipolygon': (shapely.GeometryType.MULTIPOLYGON, 3),
+}
+# Khoảng trắng quanh dấu phẩy trong một bộ toạ độ KML ("lon, lat")
+COORD_SEPARATOR = re.compile(r'\s+,\s*|,\s+')
+FD_PATH_PREFIX = "/proc/self/fd/"
+
+class FeatureBatch(NamedTuple):
+    # Một lô feature đã giải mã theo cột: tên, properties (chuỗi JSON) và mảng geometry shapely.
+    # crs là hệ toạ độ nguồn (None nghĩa là EPSG:4326)
+    names: list
+    properties: list
+    geometries: object
+    crs: Optional[str] = None
+
+def detect_geojson_crs(file_like):
+    # Thành viên "crs" (GeoJSON cũ) thường nằm trước "features": chỉ đọc phần đầu file
+    for prefix, event, value in ijson.parse(file_like):
+        if prefix == 'crs.properties.name' and event == 'string':
+            return value
+        if prefix == 'features' and event == 'start_array':
+            break
+    return None
 
 def process_json(file_like):
-    geojson_data = geojson_loads(file_like.read().decode('utf-8'))
-    features = []
-    if 'features' in geojson_data:
-        for feature in geojson_data['features']:
-            geom = shape(feature['geometry'])
-            properties = feature.get('properties', {})
-            features.append({
-                'geometry': geom,
-                'properties': properties
-            })
-    return features
+    # Đọc từng feature trong mảng "features" trực tiếp từ file upload (spooled file),
+    # không nạp cả FeatureCollection vào bộ nhớ
+    file_like.seek(0)
+    crs = detect_geojson_crs(file_like)
+    file_like.seek(0)
+    for feature in ijson.items(file_like, 'features.item', use_float=True):
+        geom = shape(feature['geometry'])
+        properties = feature.get('properties') or {}
+        yield {
+            'geometry': geom,
+            'properties': properties,
+            'crs': crs
+        }
+
+def file_descriptor_path(file_like):
+    if hasattr(file_like, 'rollover'):
+        file_like.rollover()
+    try:
+        fd = file_like.fileno()
+        file_like.flush()
+    except (AttributeError, OSError, ValueError):
+        return None
+    path = f"{FD_PATH_PREFIX}{fd}"
+    return path if os.path.exists(path) else None
+
+def gdal_path(path):
+    # SQLite (GPKG) không mở được /proc/self/fd/N trực tiếp: đọc qua lớp file ảo của GDAL
+    if path.startswith(FD_PATH_PREFIX):
+        return f"/vsisubfile/0_{os.path.getsize(path)},{path}"
+    return path
+
+@contextmanager
+def local_path(file_like, suffix):
+    # GDAL cần đường dẫn trên đĩa: dùng thẳng file nếu có tên. File upload (SpooledTemporaryFile,
+    # name là số fd) được ép ghi hẳn ra đĩa rồi mở lại qua /proc/self/fd, không chép thêm bản nào.
+    # Chỉ khi không có cả hai mới chép theo khối ra file tạm
+    name = getattr(file_like, 'name', None)
+    if isinstance(name, str) and os.path.isfile(name):
+        yield name
+        return
+    fd_path = file_descriptor_path(file_like)
+    if fd_path:
+        yield fd_path
+        return
+    fd, path = tempfile.mkstemp(suffix=suffix)
+    try:
+        with os.fdopen(fd, 'wb') as out:
+            file_like.seek(0)
+            shutil.copyfileobj(file_like, out, COPY_BUFFER_SIZE)
+        yield path
+    finally:
+        os.remove(path)
+
+@contextmanager
+def open_kmz_document(file_like):
+    # zipfile đọc thẳng từ file upload đã spool ra đĩa và giải nén KML theo luồng,
+    # không nạp cả KMZ vào bộ nhớ. Trả về (luồng KML, kích thước KML sau giải nén)
+    file_like.seek(0)
+    with ZipFile(file_like) as kmz:
+        kml_info = [info for info in kmz.infolist() if info.filename.endswith('.kml')][0]
+        with kmz.open(kml_info) as kml:
+            yield kml, kml_info.file_size
 
 def process_kmz(file_like):
-    with ZipFile(BytesIO(file_like.read())) as kmz:
-        kml_file = [f for f in kmz.namelist() if f.endswith('.kml')][0]
-        with kmz.open(kml_file) as kml:
-            kml_content = kml.read()
-            root = kml_parser.fromstring(kml_content)
-            features = []
-            if hasattr(root, 'Document'):
-                for element in root.Document.getchildren():
-                    if element.tag.endswith('Placemark'):
-                        feature = process_placemark(element)
-                        if feature['geometry']:
-                            features.append(feature)
-                    elif element.tag.endswith('Folder'):
-                        process_folder(element, features)
-            else:
-                for element in root.getchildren():
-                    if element.tag.endswith('Placemark'):
-                        feature = process_placemark(element)
-                        if feature['geometry']:
-                            features.append(feature)
-                    elif element.tag.endswith('Folder'):
-                        process_folder(element, features)
-            return features
+    with open_kmz_document(file_like) as (kml, _):
+        yield from iter_kml_placemarks(kml)
+
+def iter_kml_placemarks(kml):
+    # Đọc KML theo sự kiện: xử lý từng Placemark (kể cả trong Folder lồng nhau)
+    # rồi giải phóng phần tử ngay để bộ nhớ không tăng theo kích thước file.
+    # Placemark có toạ độ hỏng được trả về kèm 'error' để bộ chèn bỏ qua và ghi vào báo cáo,
+    # không làm hỏng cả file
+    for _, placemark in etree.iterparse(kml, events=('end',), tag='{*}Placemark', huge_tree=True):
+        try:
+            feature = process_placemark(placemark)
+        except ValueError as error:
+            feature = {'geometry': None, 'properties': {}, 'error': str(error)}
+        placemark.clear()
+        while placemark.getprevious() is not None:
+            del placemark.getparent()[0]
+        if feature['geometry'] is not None or 'error' in feature:
+            yield feature
+
+def local_tag(element):
+    return etree.QName(element).localname
 
 def process_placemark(placemark):
-    properties = {'name': str(placemark.name)} if hasattr(placemark, 'name') else {}
+    name = placemark.find('{*}name')
+    properties = {'name': name.text or ''} if name is not None else {}
     geometry = None
-    if hasattr(placemark, 'Point'):
-        coords = parse_coordinates(placemark.Point.coordinates.text)
-        geometry = Point(coords[0])
-    elif hasattr(placemark, 'LineString'):
-        coords = parse_coordinates(placemark.LineString.coordinates.text)
-        geometry = LineString(coords)
-    elif hasattr(placemark, 'Polygon'):
-        if hasattr(placemark.Polygon, 'outerBoundaryIs') and hasattr(placemark.Polygon.outerBoundaryIs, 'LinearRing'):
-            outer_coords = parse_coordinates(placemark.Polygon.outerBoundaryIs.LinearRing.coordinates.text)
-            geometry = Polygon(outer_coords)
-    elif hasattr(placemark, 'MultiGeometry'):
-        geometries = []
-        for geom in placemark.MultiGeometry.getchildren():
-            geom_tag = geom.tag.split('}')[-1]
-            if geom_tag == 'Point':
-                coords = parse_coordinates(geom.coordinates.text)
-                geometries.append(Point(coords[0]))
-            elif geom_tag == 'LineString':
-                coords = parse_coordinates(geom.coordinates.text)
-                geometries.append(LineString(coords))
-            elif geom_tag == 'Polygon':
-                if hasattr(geom, 'outerBoundaryIs') and hasattr(geom.outerBoundaryIs, 'LinearRing'):
-                    outer_coords = parse_coordinates(geom.outerBoundaryIs.LinearRing.coordinates.text)
-                    geometries.append(Polygon(outer_coords))
-        if geometries:
-            if all(isinstance(g, Point) for g in geometries):
-                geometry = MultiPoint(geometries)
-            elif all(isinstance(g, LineString) for g in geometries):
-                geometry = MultiLineString(geometries)
-            elif all(isinstance(g, Polygon) for g in geometries):
-                geometry = MultiPolygon(geometries)
+    for child in placemark:
+        if isinstance(child.tag, str) and local_tag(child) in KML_GEOMETRY_TAGS:
+            geometry = parse_kml_geometry(child)
+            break
     return {'geometry': geometry, 'properties': properties}
 
+def parse_kml_geometry(element):
+    tag = local_tag(element)
+    if tag == 'Point':
+        coords = parse_coordinates(element.findtext('{*}coordinates'))
+        return shapely.points(coords[0]) if len(coords) else None
+    if tag in ('LineString', 'LinearRing'):
+        coords = parse_coordinates(element.findtext('{*}coordinates'))
+        return shapely.linestrings(coords) if len(coords) >= 2 else None
+    if tag == 'Polygon':
+        outer = element.findtext('{*}outerBoundaryIs/{*}LinearRing/{*}coordinates')
+        if outer is None:
+            return None
+        holes = [parse_coordinates(text) for text in element.xpath('*[local-name()="innerBoundaryIs"]/*[local-name()="LinearRing"]/*[local-name()="coordinates"]/text()')]
+        return shapely.polygons(parse_coordinates(outer), holes=holes or None)
+    if tag == 'MultiGeometry':
+        geometries = [parse_kml_geometry(child) for child in element if isinstance(child.tag, str) and local_tag(child) in KML_GEOMETRY_TAGS]
+        return combine_geometries([g for g in geometries if g is not None])
+    return None
+
+def combine_geometries(geometries):
+    if not geometries:
+        return None
+    # Tách các Multi*/GeometryCollection lồng nhau thành các phần đơn
+    parts = shapely.get_parts(geometries)
+    geom_types = set(shapely.get_type_id(parts))
+    if geom_types == {shapely.GeometryType.POINT}:
+        return shapely.multipoints(parts)
+    if geom_types == {shapely.GeometryType.LINESTRING}:
+        return shapely.multilinestrings(parts)
+    if geom_types == {shapely.GeometryType.POLYGON}:
+        return shapely.multipolygons(parts)
+    return shapely.geometrycollections(parts)
+
 def parse_coordinates(coord_str):
-    coords = []
-    for coord in coord_str.strip().split():
-        lon, lat = map(float, coord.split(',')[:2])
-        coords.append((lon, lat))
+    # Giải mã cả chuỗi "lon,lat[,alt] lon,lat[,alt] ..." thành mảng NumPy (n, 2) trong một lần
+    coord_str = COORD_SEPARATOR.sub(',', (coord_str or '').strip())
+    if not coord_str:
+        return np.empty((0, 2))
+    tuples = coord_str.split()
+    dims = tuples[0].count(',') + 1
+    try:
+        values = np.fromstring(coord_str.replace(',', ' '), sep=' ')
+    except ValueError:
+        values = None
+    if values is not None and dims >= 2 and values.size == len(tuples) * dims:
+        return values.reshape(-1, dims)[:, :2]
+    # Các bộ có số chiều khác nhau (2D lẫn 3D) hoặc có giá trị hỏng: đọc từng bộ
+    return parse_coordinate_tuples(tuples)
+
+def parse_coordinate_tuples(tuples):
+    coords = np.empty((len(tuples), 2))
+    for i, item in enumerate(tuples):
+        parts = item.split(',')
+        if not 2 <= len(parts) <= 3:
+            raise ValueError(f"Malformed KML coordinate tuple: {item[:50]}")
+        try:
+            coords[i] = float(parts[0]), float(parts[1])
+        except ValueError:
+            raise ValueError(f"Malformed KML coordinate tuple: {item[:50]}") from None
     return coords
 
-def process_folder(folder, features):
-    for element in folder.getchildren():
-        if element.tag.endswith('Placemark'):
-            feature = process_placemark(element)
-            if feature['geometry']:
-                features.append(feature)
-        elif element.tag.endswith('Folder'):
-            process_folder(element, features)
+def arrow_attributes(table, name_key='VARNAME_1'):
+    # Tên feature và properties (chuỗi JSON) của cả lô từ các cột thuộc tính Arrow
+    if table.num_columns:
+        properties = table.to_pandas().to_json(orient='records', lines=True, date_format='iso', double_precision=15, force_ascii=False).split('\n')[:table.num_rows]
+    else:
+        properties = ['{}'] * table.num_rows
+    if name_key in table.column_names:
+        names = [name if name is not None else 'COUNTRY' for name in table.column(name_key).to_pylist()]
+    else:
+        names = ['COUNTRY'] * table.num_rows
+    return names, properties
+
+def read_arrow_batches(path_or_buffer, layer=None, name_key='VARNAME_1', batch_size=ARROW_BATCH_SIZE):
+    # Đọc layer theo từng RecordBatch Arrow qua pyogrio; geometry (WKB) và properties
+    # được giải mã theo cột cho cả lô, không duyệt từng dòng như iterrows
+    with open_arrow(path_or_buffer, layer=layer, batch_size=batch_size, use_pyarrow=True) as (meta, reader):
+        geometry_column = meta['geometry_name'] or 'wkb_geometry'
+        for record_batch in reader:
+            table = pa.Table.from_batches([record_batch])
+            geometries = shapely.from_wkb(table.column(geometry_column).to_numpy(zero_copy_only=False))
+            names, properties = arrow_attributes(table.drop_columns([geometry_column]), name_key)
+            yield FeatureBatch(names=names, properties=properties, geometries=geometries, crs=meta['crs'])
 
 def process_gpkg(file_like):
-    gdf = gpd.read_file(BytesIO(file_like.read()), driver='GPKG')
-    features = []
-    for _, row in gdf.iterrows():
-        feature = {
-            'geometry': row['geometry'],
-            'properties': row.drop('geometry').to_dict()
-        }
-        features.append(feature)
-    return features
+    with local_path(file_like, '.gpkg') as path:
+        yield from read_arrow_batches(gdal_path(path))
 
-def process_zip(file_like):
-    with ZipFile(BytesIO(file_like.read())) as zip_ref:
+def list_spatial_layers(path_or_buffer):
+    # Tên các layer có geometry trong một GeoPackage (bỏ qua bảng thuộc tính thuần)
+    return [name for name, geometry_type in list_layers(path_or_buffer) if geometry_type is not None]
+
+def shapefile_path(zip_path):
+    # GDAL đọc shapefile ngay trong file zip qua /vsizip/, không giải nén ra thư mục tạm
+    with ZipFile(zip_path) as zip_ref:
         shp_file = [f for f in zip_ref.namelist() if f.endswith('.shp')][0]
-        temp_dir = tempfile.mkdtemp()
-        try:
-            zip_ref.extractall(temp_dir)
-            shp_path = os.path.join(temp_dir, shp_file)
-            gdf = gpd.read_file(shp_path, driver='ESRI Shapefile')
-            features = []
-            for _, row in gdf.iterrows():
-                feature = {
-                    'geometry': row['geometry'],
-                    'properties': row.drop('geometry').to_dict()
-                }
-                features.append(feature)
-            return features
-        finally:
-            shutil.rmtree(temp_dir)
\ No newline at end of file
+    # {} quanh đường dẫn: GDAL không cần phần mở rộng .zip để nhận ra file nén (vd. /proc/self/fd/N)
+    return f"/vsizip/{{{zip_path}}}/{shp_file}"
+
+def process_zip(file_like):
+    with local_path(file_like, '.zip') as path:
+        yield from read_arrow_batches(shapefile_path(path))
+
+def process_fgb(file_like):
+    # FlatGeobuf: GDAL trả về thẳng luồng Arrow
+    with local_path(file_like, '.fgb') as path:
+        yield from read_arrow_batches(gdal_path(path))
+
+def geoparquet_crs(column_meta):
+    # "crs" là PROJJSON; không có khoá crs nghĩa là OGC:CRS84 (lon/lat WGS84)
+    if 'crs' not in column_meta:
+        return None
+    if column_meta['crs'] is None:
+        raise ValueError("GeoParquet geometry column has an unknown CRS")
+    crs = CRS.from_json_dict(column_meta['crs'])
+    authority = crs.to_authority()
+    return ':'.join(authority) if authority else crs.to_wkt()
+
+def geoarrow_coordinates(array):
+    # Toạ độ GeoArrow dạng struct<x, y, ...> hoặc fixed_size_list<double>[n]; chỉ lấy x, y.
+    # to_numpy trên buffer double không null là zero-copy
+    if pa.types.is_struct(array.type):
+        return np.column_stack([array.field('x').to_numpy(), array.field('y').to_numpy()])
+    return array.flatten().to_numpy().reshape(-1, array.type.list_size)[:, :2]
+
+def geoarrow_to_shapely(array, encoding):
+    # Dựng geometry từ buffer toạ độ và các mảng offset của GeoArrow bằng shapely.from_ragged_array,
+    # không đi qua WKB
+    if isinstance(array, pa.ChunkedArray):
+        array = array.combine_chunks()
+    geometry_type, depth = GEOARROW_ENCODINGS[encoding]
+    offsets = []
+    values = array
+    for _ in range(depth):
+        value_offsets = values.offsets.to_numpy()
+        offsets.insert(0, value_offsets - value_offsets[0])
+        values = values.flatten()
+    geometries = shapely.from_ragged_array(geometry_type, geoarrow_coordinates(values), tuple(offsets) or None)
+    if array.null_count:
+        geometries[array.is_null().to_numpy(zero_copy_only=False)] = None
+    return geometries
+
+def process_parquet(file_like, name_key='VARNAME_1', batch_size=ARROW_BATCH_SIZE):
+    # GeoParquet: đọc theo từng lô qua pyarrow; cột geometry mã hoá WKB hoặc GeoArrow gốc
+    with local_path(file_like, '.parquet') as path:
+        parquet = pq.ParquetFile(path)
+        geo = json.loads((parquet.schema_arrow.metadata or {}).get(b'geo', b'null'))
+        if not geo:
+            raise ValueError("Parquet file has no GeoParquet 'geo' metadata")
+        geometry_column = geo['primary_column']
+        column_meta = geo['columns'][geometry_column]
+        encoding = column_meta.get('encoding', 'WKB').lower()
+        if encoding != 'wkb' and encoding not in GEOARROW_ENCODINGS:
+            raise ValueError(f"Unsupported GeoParquet geometry encoding: {encoding}")
+        crs = geoparquet_crs(column_meta)
+        # Bỏ các cột geometry khác và cột bbox (covering) khỏi properties
+        skip = set(geo['columns'])
+        for meta in geo['columns'].values():
+            skip.update(path_parts[0] for path_parts in meta.get('covering', {}).get('bbox', {}).values())
+        for record_batch in parquet.iter_batches(batch_size=batch_size):
+            table = pa.Table.from_batches([record_batch])
+            column = table.column(geometry_column)
+            if encoding == 'wkb':
+                geometries = shapely.from_wkb(column.to_numpy(zero_copy_only=False))
+            else:
+                geometries = geoarrow_to_shapely(column, encoding)
+            names, properties = arrow_attributes(table.drop_columns([name for name in table.column_names if name in skip]), name_key)
+            yield FeatureBatch(names=names, properties=properties, geometries=geometries, crs=crs)
+
+# Ánh xạ phần mở rộng file upload -> hàm đọc tương ứng
+PARSERS = {
+    'json': process_json,
+    'geojson': process_json,
+    'kmz': process_kmz,
+    'gpkg': process_gpkg,
+    'zip': process_zip,
+    'fgb': process_fgb,
+    'parquet': process_parquet,
+    'geoparquet': process_parquet,
+}
+
+def get_extension(filename):
+    return filename.rsplit('.', 1)[1].lower() if '.' in filename else ''
+
+def get_parser(extension):
+    parser = PARSERS.get(extension)
+    if parser is None:
+        raise ValueError("Unsupported file format")
+    return parser
@@ -0,0 +1,62 @@
+import numpy as np
+import shapely
+from sqlalchemy import func, select, case
+from model.features import Feature
+from utils.geometry_store import resolved_geometry
+
+# Các mức geometry đơn giản hoá lưu sẵn cho mỗi feature: (cột, tolerance theo độ),
+# từ chi tiết đến thô. Mức nào không bớt được đỉnh nào thì để NULL và đọc lùi về mức trước.
+GEOMETRY_LEVELS = (
+    ('geom_lod1', 0.0001),  # ~11 m
+    ('geom_lod2', 0.001),   # ~110 m
+    ('geom_lod3', 0.01),    # ~1.1 km
+)
+
+def simplify_levels(geometries):
+    # Đơn giản hoá giữ topology theo cả mảng, mức sau lấy từ mức trước cho nhanh
+    levels = {}
+    source = geometries
+    source_count = shapely.get_num_coordinates(geometries)
+    for column, tolerance in GEOMETRY_LEVELS:
+        simplified = shapely.simplify(source, tolerance, preserve_topology=True)
+        count = shapely.get_num_coordinates(simplified)
+        reduced = count < source_count
+        levels[column] = np.where(reduced, simplified, None)
+        source = np.where(reduced, simplified, source)
+        source_count = np.where(reduced, count, source_count)
+    return levels
+
+def level_update(column, tolerance, source):
+    # Giống simplify_levels: đơn giản hoá từ mức trước (source), để NULL nếu không bớt được đỉnh nào
+    simplified = select(func.ST_SimplifyPreserveTopology(source, tolerance).label('geom')).correlate(Feature).subquery('simplified')
+    return {getattr(Feature, column): select(
+        case((func.ST_NPoints(simplified.c.geom) < func.ST_NPoints(source), simplified.c.geom))
+    ).correlate(Feature).scalar_subquery()}
+
+def refresh_geometry_levels(db, *criteria):
+    # Cập nhật lần lượt từng mức để mức sau đọc được giá trị mới của mức trước
+    previous = ['geom']
+    for column, tolerance in GEOMETRY_LEVELS:
+        source = func.coalesce(*[getattr(Feature, name) for name in previous]) if len(previous) > 1 else Feature.geom
+        db.query(Feature).filter(*criteria).update(level_update(column, tolerance, source), synchronize_session=False)
+        previous.insert(0, column)
+
+def pixel_size(zoom):
+    # Kích thước một pixel (độ) của tile 256px ở mức zoom
+    return 360.0 / (256 * 2 ** zoom)
+
+def level_columns(zoom=None, tolerance=None):
+    # Chọn mức thô nhất có tolerance không vượt quá kích thước pixel, lùi dần về geom gốc
+    if tolerance is None and zoom is not None:
+        tolerance = pixel_size(zoom)
+    columns = ['geom']
+    if tolerance is not None:
+        for column, level_tolerance in GEOMETRY_LEVELS:
+            if level_tolerance > tolerance:
+                break
+            columns.insert(0, column)
+    return tuple(columns)
+
+def geometry_for(zoom=None, tolerance=None):
+    # Feature dùng geometry chung được đọc từ geometry_store
+    return resolved_geometry(*level_columns(zoom, tolerance))
@@ -0,0 +1,50 @@
+from sqlalchemy import func, select, or_
+from sqlalchemy.dialects.postgresql import insert
+from model.features import Feature
+from model.geometry_store import GeometryStore
+
+# Các cột geometry có ở cả features và geometry_store (xem utils/geometry_levels.py)
+GEOMETRY_COLUMNS = ('geom', 'geom_lod1', 'geom_lod2', 'geom_lod3')
+
+def geometry_hash(geom=Feature.geom):
+    # Cùng một geometry (kể cả SRID) luôn cho cùng một hash
+    return func.md5(func.ST_AsEWKB(geom))
+
+def stored_geometry(*columns):
+    # Subquery tương quan lấy geometry chung của feature; COALESCE chỉ chạy nó
+    # với các feature không có geom riêng
+    values = [getattr(GeometryStore, column) for column in columns]
+    return select(func.coalesce(*values) if len(values) > 1 else values[0]).where(
+        GeometryStore.geom_hash == Feature.geom_hash
+    ).scalar_subquery()
+
+def resolved_geometry(*columns):
+    # Các cột geometry theo thứ tự ưu tiên, đọc trên feature trước rồi tới geometry_store
+    columns = columns or ('geom',)
+    return func.coalesce(*[getattr(Feature, column) for column in columns], stored_geometry(*columns))
+
+def geometry_overlaps(envelope):
+    # Lọc theo bbox, dùng GIST index của cả features.geom lẫn geometry_store.geom
+    shared = select(GeometryStore.geom_hash).where(GeometryStore.geom.op('&&')(envelope))
+    return or_(Feature.geom.op('&&')(envelope), Feature.geom_hash.in_(shared))
+
+def intern_geometries(db, *criteria):
+    # Chuyển geometry riêng của các feature thoả criteria vào geometry_store (bỏ qua hash đã có),
+    # rồi để feature trỏ tới bản chung. Trả về số feature được chuyển.
+    owned = (Feature.geom.isnot(None),) + criteria
+    source = select(
+        geometry_hash().label('geom_hash'),
+        *[getattr(Feature, column) for column in GEOMETRY_COLUMNS]
+    ).where(*owned).distinct(geometry_hash())
+    db.execute(
+        insert(GeometryStore).from_select(['geom_hash', *GEOMETRY_COLUMNS], source)
+        .on_conflict_do_nothing(index_elements=['geom_hash'])
+    )
+    values = {getattr(Feature, column): None for column in GEOMETRY_COLUMNS}
+    values[Feature.geom_hash] = geometry_hash()
+    return db.query(Feature).filter(*owned).update(values, synchronize_session=False)
+
+def purge_unreferenced_geometries(db):
+    # Dọn các geometry chung không còn feature nào trỏ tới (feature/layer đã xoá hoặc đã sửa geometry)
+    referenced = select(Feature.feature_id).where(Feature.geom_hash == GeometryStore.geom_hash).exists()
+    return db.query(GeometryStore).filter(~referenced).delete(synchronize_session=False)
@@ -0,0 +1,50 @@
+import time
+import numpy as np
+import shapely
+
+def new_validation_report():
+    return {'checked': 0, 'invalid': 0, 'repaired': 0, 'dropped_empty': 0, 'malformed': 0, 'reasons': {}, 'seconds': 0}
+
+def repair_geometries(geometries, invalid, report=None):
+    # Sửa các geometry đánh dấu invalid bằng make_valid, trả về mảng mới
+    if report is not None:
+        report['invalid'] += int(invalid.sum())
+        for reason in shapely.is_valid_reason(geometries[invalid]):
+            # "Self-intersection[105.1 21.2]" -> "Self-intersection"
+            reason = reason.split('[', 1)[0]
+            report['reasons'][reason] = report['reasons'].get(reason, 0) + 1
+    geometries = geometries.copy()
+    geometries[invalid] = shapely.make_valid(geometries[invalid], method='structure', keep_collapsed=False)
+    return geometries
+
+def validate_batches(feature_batches, report):
+    # Kiểm tra và sửa geometry theo cả mảng: loại geometry rỗng, make_valid các geometry
+    # không hợp lệ và chuẩn hoá chiều vòng (ngoài ngược chiều kim đồng hồ như RFC 7946)
+    for feature_batch in feature_batches:
+        started = time.perf_counter()
+        geometries = np.asarray(feature_batch.geometries, dtype=object)
+        report['checked'] += len(geometries)
+
+        empty = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+        invalid = ~empty & ~shapely.is_valid(geometries)
+        if invalid.any():
+            geometries = repair_geometries(geometries, invalid, report)
+            repaired_empty = shapely.is_missing(geometries) | shapely.is_empty(geometries)
+            report['repaired'] += int((invalid & ~repaired_empty).sum())
+            empty = repaired_empty
+
+        keep = ~empty
+        report['dropped_empty'] += int(empty.sum())
+        report['seconds'] += time.perf_counter() - started
+        if not keep.any():
+            continue
+        if empty.any():
+            keep_index = np.flatnonzero(keep)
+            feature_batch = feature_batch._replace(
+                names=[feature_batch.names[i] for i in keep_index],
+                properties=[feature_batch.properties[i] for i in keep_index],
+                geometries=geometries[keep],
+            )
+        else:
+            feature_batch = feature_batch._replace(geometries=geometries)
+        yield feature_batch._replace(geometries=shapely.orient_polygons(feature_batch.geometries))
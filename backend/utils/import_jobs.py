@@ -0,0 +1,306 @@
+import os
+import shutil
+import logging
+import tempfile
+import threading
+import multiprocessing
+from datetime import timedelta
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor, as_completed
+from sqlalchemy import literal, func, or_
+from sqlalchemy.dialects.postgresql import JSONB, array
+from model.connect import SessionLocal, engine
+from model.import_jobs import ImportJob
+from model.layers import Layer
+from utils.file_processor import get_parser, read_arrow_batches
+from utils.bulk_insert import bulk_insert_features
+from utils.versions import bump_layer_versions
+
+logger = logging.getLogger(__name__)
+
+# Thư mục lưu file upload chờ xử lý; phải nằm trên ổ đĩa bền vững để job chạy lại được sau khi restart
+IMPORT_DIR = os.getenv("IMPORT_DIR", os.path.join(tempfile.gettempdir(), "gis_imports"))
+IMPORT_WORKERS = int(os.getenv("IMPORT_WORKERS", "2"))
+# Số process giải mã/chèn song song các layer của một GeoPackage nhiều layer
+IMPORT_PROCESSES = int(os.getenv("IMPORT_PROCESSES", str(os.cpu_count() or 2)))
+# Khoảng thời gian (giây) tối thiểu giữa hai lần ghi tiến độ vào database
+PROGRESS_INTERVAL = 1.0
+# Job đang chạy mà không cập nhật quá lâu được xem là bị bỏ dở (worker đã chết). Process đang
+# chạy job gia hạn updated_at mỗi LEASE_RENEW_INTERVAL nên chỉ job của process đã chết bị coi là cũ
+STALE_JOB_AFTER = timedelta(minutes=5)
+LEASE_RENEW_INTERVAL = timedelta(minutes=1)
+
+ACTIVE_STAGES = ("queued", "parsing", "inserting")
+
+executor = ThreadPoolExecutor(max_workers=IMPORT_WORKERS, thread_name_prefix="import-job")
+process_pool = None
+process_pool_lock = threading.Lock()
+# Các job process này đang chạy
+running_jobs = set()
+running_jobs_lock = threading.Lock()
+
+def init_worker_process():
+    # Process con không được dùng lại các kết nối trong pool kế thừa từ process cha
+    engine.dispose(close=False)
+
+def get_process_pool():
+    # Được gọi từ nhiều thread import: khoá để chỉ tạo một pool. Process con được tạo bằng
+    # "spawn" thay vì fork từ process uvicorn nhiều thread (tránh kế thừa lock đang bị giữ
+    # của connection pool, logging...)
+    global process_pool
+    with process_pool_lock:
+        if process_pool is None:
+            process_pool = ProcessPoolExecutor(
+                max_workers=IMPORT_PROCESSES,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=init_worker_process,
+            )
+        return process_pool
+
+def spool_upload(upload_file, extension):
+    os.makedirs(IMPORT_DIR, exist_ok=True)
+    fd, path = tempfile.mkstemp(suffix='.' + extension, dir=IMPORT_DIR)
+    with os.fdopen(fd, 'wb') as out:
+        upload_file.file.seek(0)
+        shutil.copyfileobj(upload_file.file, out, 1024 * 1024)
+    return path
+
+def create_import_job(db, user_id, layer_id, upload_file, extension, delete_layer_on_failure=False):
+    file_path = spool_upload(upload_file, extension)
+    return enqueue_import_file(db, user_id, layer_id, file_path, upload_file.filename, extension, delete_layer_on_failure)
+
+def enqueue_import_file(db, user_id, layer_id, file_path, file_name, extension, delete_layer_on_failure=False, layer_progress=None):
+    # file_path phải nằm trong IMPORT_DIR: job sẽ xoá file sau khi xử lý xong
+    job = ImportJob(
+        user_id=user_id,
+        layer_id=layer_id,
+        file_name=file_name,
+        file_path=file_path,
+        extension=extension,
+        mode="multi_layer" if layer_progress else "single",
+        stage="queued",
+        delete_layer_on_failure=delete_layer_on_failure,
+        layer_progress=layer_progress,
+    )
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+    executor.submit(run_import_job, job.job_id)
+    return job
+
+def update_job(job_id, **values):
+    # Ghi trạng thái bằng session riêng để client thấy tiến độ trong khi
+    # transaction chèn feature của job vẫn chưa commit
+    session = SessionLocal()
+    try:
+        updated = session.query(ImportJob).filter(ImportJob.job_id == job_id).update(values, synchronize_session=False)
+        session.commit()
+        return updated
+    finally:
+        session.close()
+
+def update_layer_progress(job_id, source_layer, **values):
+    # Gộp tiến độ của một layer nguồn vào cột JSONB ngay trong câu UPDATE, để nhiều
+    # process cùng ghi mà không ghi đè tiến độ của nhau
+    session = SessionLocal()
+    try:
+        entry = func.coalesce(ImportJob.layer_progress[source_layer], literal({}, JSONB)).op('||')(literal(values, JSONB))
+        session.query(ImportJob).filter(ImportJob.job_id == job_id).update({
+            ImportJob.layer_progress: func.jsonb_set(ImportJob.layer_progress, array([source_layer]), entry)
+        }, synchronize_session=False)
+        session.commit()
+    finally:
+        session.close()
+
+def claim_job(job_id):
+    # Chỉ một worker được chuyển job từ "queued" sang "parsing"
+    session = SessionLocal()
+    try:
+        claimed = session.query(ImportJob).filter(
+            ImportJob.job_id == job_id,
+            ImportJob.stage == "queued"
+        ).update({"stage": "parsing", "feature_count": 0, "error": None}, synchronize_session=False)
+        session.commit()
+        return claimed == 1
+    finally:
+        session.close()
+
+def remove_file(path):
+    try:
+        os.remove(path)
+    except OSError:
+        pass
+
+@contextmanager
+def job_lease(job_id):
+    with running_jobs_lock:
+        running_jobs.add(job_id)
+    try:
+        yield
+    finally:
+        with running_jobs_lock:
+            running_jobs.discard(job_id)
+
+def run_import_job(job_id):
+    if not claim_job(job_id):
+        return
+    with job_lease(job_id):
+        import_job(job_id)
+
+def import_job(job_id):
+    db = SessionLocal()
+    job = db.query(ImportJob).filter(ImportJob.job_id == job_id).first()
+    if job.mode == "multi_layer":
+        db.close()
+        return run_multi_layer_job(job_id, job)
+    last_report = [0.0]
+
+    def on_progress(count, elapsed):
+        if elapsed - last_report[0] >= PROGRESS_INTERVAL:
+            last_report[0] = elapsed
+            update_job(job_id, stage="inserting", feature_count=count, features_per_second=round(count / elapsed, 1) if elapsed > 0 else None)
+
+    try:
+        with open(job.file_path, 'rb') as file_like:
+            features_data = get_parser(job.extension)(file_like)
+            _, stats = bulk_insert_features(db, job.layer_id, features_data, job.extension, on_progress=on_progress, return_rows=False)
+        bump_layer_versions(db, [job.layer_id])
+        db.commit()
+        update_job(job_id, stage="done", feature_count=stats['inserted'], features_per_second=stats['features_per_second'], report=stats)
+        remove_file(job.file_path)
+    except Exception as e:
+        # Các feature nằm trong một transaction nên rollback không để lại dữ liệu dở dang
+        db.rollback()
+        logger.exception("Import job %s failed", job_id)
+        if job.delete_layer_on_failure and job.layer_id:
+            bump_layer_versions(db, [job.layer_id])
+            db.query(Layer).filter(Layer.layer_id == job.layer_id).delete(synchronize_session=False)
+            db.commit()
+        update_job(job_id, stage="failed", error=str(e))
+        remove_file(job.file_path)
+    finally:
+        db.close()
+
+def import_gpkg_layer(job_id, file_path, source_layer, layer_id):
+    # Chạy trong process con: đọc một layer của GeoPackage và chèn vào layer đích
+    # trong transaction riêng, báo tiến độ theo từng layer
+    db = SessionLocal()
+    last_report = [0.0]
+
+    def on_progress(count, elapsed):
+        if elapsed - last_report[0] >= PROGRESS_INTERVAL:
+            last_report[0] = elapsed
+            update_layer_progress(job_id, source_layer, stage="inserting", feature_count=count, features_per_second=round(count / elapsed, 1) if elapsed > 0 else None)
+
+    try:
+        update_layer_progress(job_id, source_layer, stage="parsing", feature_count=0, error=None)
+        _, stats = bulk_insert_features(db, layer_id, read_arrow_batches(file_path, layer=source_layer), 'gpkg', on_progress=on_progress, return_rows=False)
+        bump_layer_versions(db, [layer_id])
+        db.commit()
+        update_layer_progress(job_id, source_layer, stage="done", feature_count=stats['inserted'], features_per_second=stats['features_per_second'], source_crs=stats['source_crs'], validation=stats['validation'])
+        return stats
+    except Exception as e:
+        db.rollback()
+        update_layer_progress(job_id, source_layer, stage="failed", error=str(e))
+        raise
+    finally:
+        db.close()
+
+def run_multi_layer_job(job_id, job):
+    # Mỗi layer nguồn là một tác vụ trong process pool; các layer đã "done" từ lần
+    # chạy trước (trước khi restart) được bỏ qua
+    pending = {name: entry for name, entry in job.layer_progress.items() if entry.get("stage") != "done"}
+    total = sum(entry.get("feature_count") or 0 for name, entry in job.layer_progress.items() if name not in pending)
+    errors = []
+    update_job(job_id, stage="inserting", feature_count=total)
+    try:
+        futures = {
+            get_process_pool().submit(import_gpkg_layer, job_id, job.file_path, name, entry["layer_id"]): (name, entry)
+            for name, entry in pending.items()
+        }
+    except Exception as e:
+        # Pool hỏng (BrokenProcessPool) hoặc không tạo được process: job thất bại thay vì treo ở "inserting"
+        logger.exception("Import job %s: cannot submit layers", job_id)
+        futures = {}
+        errors.append(f"Cannot start import processes: {e}")
+        failed = list(pending.items())
+    else:
+        failed = []
+    for future in as_completed(futures):
+        name, entry = futures[future]
+        try:
+            total += future.result()['inserted']
+            update_job(job_id, feature_count=total)
+        except Exception as e:
+            logger.exception("Import job %s: layer %s failed", job_id, name)
+            errors.append(f"{name}: {e}")
+            failed.append((name, entry))
+    if job.delete_layer_on_failure:
+        for name, entry in failed:
+            session = SessionLocal()
+            try:
+                bump_layer_versions(session, [entry["layer_id"]])
+                session.query(Layer).filter(Layer.layer_id == entry["layer_id"]).delete(synchronize_session=False)
+                session.commit()
+            finally:
+                session.close()
+    if errors:
+        update_job(job_id, stage="failed", feature_count=total, error="; ".join(errors))
+    else:
+        update_job(job_id, stage="done", feature_count=total)
+    remove_file(job.file_path)
+
+def renew_job_leases():
+    # Gia hạn các job process này đang chạy, kể cả khi một lô chèn kéo dài hơn STALE_JOB_AFTER
+    with running_jobs_lock:
+        job_ids = list(running_jobs)
+    if not job_ids:
+        return 0
+    session = SessionLocal()
+    try:
+        renewed = session.query(ImportJob).filter(
+            ImportJob.job_id.in_(job_ids), ImportJob.stage.in_(ACTIVE_STAGES)
+        ).update({ImportJob.updated_at: func.now()}, synchronize_session=False)
+        session.commit()
+        return renewed
+    finally:
+        session.close()
+
+def resume_import_jobs(include_queued=True):
+    # Đưa lại vào hàng đợi các job chưa xong mà không process nào giữ: khi server khởi động
+    # (kèm mọi job "queued") và định kỳ qua scheduler. So sánh thời gian ngay trong SQL với
+    # now() để cùng múi giờ với updated_at do database ghi
+    renew_job_leases()
+    session = SessionLocal()
+    try:
+        stale = ImportJob.updated_at < func.now() - STALE_JOB_AFTER
+        with running_jobs_lock:
+            own_jobs = list(running_jobs)
+        jobs = session.query(ImportJob).filter(
+            ImportJob.stage.in_(ACTIVE_STAGES),
+            or_(ImportJob.stage == "queued", stale) if include_queued else stale,
+            ImportJob.job_id.notin_(own_jobs),
+        ).with_for_update(skip_locked=True).all()
+        resumed = []
+        for job in jobs:
+            if not os.path.exists(job.file_path):
+                job.stage = "failed"
+                job.error = "Uploaded file is no longer available"
+                continue
+            job.stage = "queued"
+            resumed.append(job.job_id)
+        session.commit()
+        for job_id in resumed:
+            executor.submit(run_import_job, job_id)
+        return len(resumed)
+    finally:
+        session.close()
+
+def requeue_stale_import_jobs():
+    # Chạy định kỳ: job bị bỏ dở sau một lần restart nhanh (chưa kịp cũ lúc khởi động) được nhận lại
+    try:
+        resumed = resume_import_jobs(include_queued=False)
+        if resumed:
+            logger.info("Requeued %d stale import jobs", resumed)
+    except Exception:
+        logger.exception("Cannot requeue stale import jobs")
@@ -0,0 +1,194 @@
+import io
+import re
+import json
+import ijson
+import numpy as np
+import shapely
+import pyarrow.parquet as pq
+from shapely.geometry import mapping
+from pyogrio import read_info
+from utils.file_processor import FeatureBatch, local_path, gdal_path, shapefile_path, open_kmz_document
+from utils.bulk_insert import iter_feature_batches
+from utils.reprojection import reproject_batches, TARGET_CRS
+from utils.geometry_validation import new_validation_report, validate_batches
+
+PREVIEW_SAMPLE_SIZE = 1000
+PREVIEW_FEATURES = 50
+# Geometry xem trước được đơn giản hoá còn khoảng 1/500 kích thước bbox của mẫu
+PREVIEW_TOLERANCE_RATIO = 1 / 500
+PREVIEW_MODES = ('head', 'reservoir')
+# Lô nhỏ để dừng đọc ngay khi đủ mẫu
+PREVIEW_BATCH_SIZE = 100
+# Ước lượng số feature GeoJSON: đọc ít nhất GEOJSON_SAMPLE_BYTES của mảng features theo khối GEOJSON_BLOCK_SIZE
+GEOJSON_SAMPLE_BYTES = 4 * 1024 * 1024
+GEOJSON_BLOCK_SIZE = 4096
+# Số byte KML (sau giải nén) được đếm Placemark để ngoại suy số feature của KMZ
+KMZ_SAMPLE_BYTES = 4 * 1024 * 1024
+KML_PLACEMARK = re.compile(rb'<(?:[\w.-]+:)?Placemark[\s>/]')
+
+GEOMETRY_TYPE_NAMES = ('Point', 'LineString', 'LinearRing', 'Polygon', 'MultiPoint', 'MultiLineString', 'MultiPolygon', 'GeometryCollection')
+JSON_TYPE_NAMES = {dict: 'object', list: 'array', str: 'string', bool: 'boolean', int: 'integer', float: 'number', type(None): 'null'}
+
+def head_sample(feature_batches, size):
+    # N feature đầu tiên; dừng đọc file ngay khi đủ
+    names, properties, geometries, crs = [], [], [], None
+    exhausted = True
+    parsed = 0
+    for feature_batch in feature_batches:
+        crs = crs or feature_batch.crs
+        parsed += len(feature_batch.names)
+        take = size - len(names)
+        names.extend(feature_batch.names[:take])
+        properties.extend(feature_batch.properties[:take])
+        geometries.extend(feature_batch.geometries[:take])
+        if len(names) >= size:
+            exhausted = len(feature_batch.names) <= take and next(feature_batches, None) is None
+            break
+    return names, properties, geometries, crs, parsed, exhausted
+
+def reservoir_sample(feature_batches, size, seed=None):
+    # Reservoir sampling (Algorithm R) trên cả file, xử lý theo lô bằng numpy
+    rng = np.random.default_rng(seed)
+    names, properties, geometries, crs = [], [], [], None
+    seen = 0
+    for feature_batch in feature_batches:
+        crs = crs or feature_batch.crs
+        count = len(feature_batch.names)
+        fill = min(max(size - len(names), 0), count)
+        names.extend(feature_batch.names[:fill])
+        properties.extend(feature_batch.properties[:fill])
+        geometries.extend(feature_batch.geometries[:fill])
+        if fill < count:
+            positions = np.arange(seen + fill, seen + count)
+            slots = rng.integers(0, positions + 1)
+            for index, slot in zip(np.flatnonzero(slots < size) + fill, slots[slots < size]):
+                names[slot] = feature_batch.names[index]
+                properties[slot] = feature_batch.properties[index]
+                geometries[slot] = feature_batch.geometries[index]
+        seen += count
+    return names, properties, geometries, crs, seen, True
+
+def estimate_feature_count(file_like, extension, parsed, exhausted):
+    # Trả về (số feature, có chính xác không); (None, False) nếu không ước lượng được
+    if exhausted:
+        return parsed, True
+    if extension in ('gpkg', 'fgb'):
+        with local_path(file_like, '.' + extension) as path:
+            return read_info(gdal_path(path), force_feature_count=True)['features'], True
+    if extension in ('parquet', 'geoparquet'):
+        with local_path(file_like, '.parquet') as path:
+            return pq.ParquetFile(path).metadata.num_rows, True
+    if extension == 'zip':
+        with local_path(file_like, '.zip') as path:
+            return read_info(shapefile_path(path), force_feature_count=True)['features'], True
+    if extension == 'kmz':
+        return estimate_kml_placemarks(file_like)
+    if extension in ('json', 'geojson'):
+        return estimate_geojson_features(file_like)
+    return None, False
+
+class ByteCounter:
+    # Bọc file, đếm số byte đã được đọc ra
+    def __init__(self, file_like):
+        self.file_like = file_like
+        self.position = 0
+
+    def read(self, size=-1):
+        data = self.file_like.read(size)
+        self.position += len(data)
+        return data
+
+def estimate_geojson_features(file_like):
+    # Đọc lại phần đầu mảng "features" theo khối nhỏ, ghi vị trí byte sau mỗi feature đọc xong,
+    # rồi ngoại suy số byte mỗi feature cho phần còn lại của file. Sai số vị trí không quá một
+    # khối (GEOJSON_BLOCK_SIZE) trên ít nhất GEOJSON_SAMPLE_BYTES byte đã đọc
+    size = file_like.seek(0, io.SEEK_END)
+    file_like.seek(0)
+    reader = ByteCounter(file_like)
+    start = end = None
+    count = 0
+    try:
+        for prefix, event, _ in ijson.parse(reader, buf_size=GEOJSON_BLOCK_SIZE):
+            if prefix == 'features' and event == 'start_array':
+                start = reader.position
+            elif prefix == 'features.item' and event == 'end_map':
+                count += 1
+                end = reader.position
+                if end - start >= GEOJSON_SAMPLE_BYTES:
+                    break
+            elif prefix == 'features' and event == 'end_array':
+                return count, True
+    except ijson.JSONError:
+        # File hỏng phía sau phần mẫu: lỗi được báo khi import, ở đây chỉ không ước lượng
+        return None, False
+    if start is None or end is None or end - start < GEOJSON_BLOCK_SIZE:
+        return None, False
+    return int(round(count * (size - start) / (end - start))), False
+
+def estimate_kml_placemarks(file_like):
+    # Đếm thẻ Placemark trong phần đầu của KML rồi ngoại suy theo kích thước sau giải nén
+    with open_kmz_document(file_like) as (kml, size):
+        sample = kml.read(KMZ_SAMPLE_BYTES)
+    count = len(KML_PLACEMARK.findall(sample))
+    if not sample or len(sample) >= size:
+        return count, True
+    return int(round(count * size / len(sample))), False
+
+def property_schema(properties):
+    schema = {}
+    for text in properties:
+        for key, value in json.loads(text).items():
+            schema.setdefault(key, set()).add(JSON_TYPE_NAMES.get(type(value), 'string'))
+    return {key: sorted(types) for key, types in schema.items()}
+
+def geometry_type_counts(geometries):
+    type_ids, counts = np.unique(shapely.get_type_id(geometries), return_counts=True)
+    return {GEOMETRY_TYPE_NAMES[type_id]: int(count) for type_id, count in zip(type_ids, counts) if type_id >= 0}
+
+def preview_import(file_like, extension, parser, mode='head', sample_size=PREVIEW_SAMPLE_SIZE, preview_features=PREVIEW_FEATURES):
+    # Chạy parser trên một mẫu của file và thống kê, không ghi gì vào database
+    validation_report = new_validation_report()
+    feature_batches = iter(iter_feature_batches(parser(file_like), extension, PREVIEW_BATCH_SIZE, validation_report))
+    if mode == 'reservoir':
+        names, properties, geometries, crs, seen, exhausted = reservoir_sample(feature_batches, sample_size)
+    else:
+        names, properties, geometries, crs, seen, exhausted = head_sample(feature_batches, sample_size)
+
+    geometry_array = np.empty(len(geometries), dtype=object)
+    geometry_array[:] = geometries
+    stage_stats = {}
+    sample = FeatureBatch(names=names, properties=properties, geometries=geometry_array, crs=crs)
+    sample = list(validate_batches(reproject_batches([sample], stage_stats), validation_report)) if names else []
+    sample = sample[0] if sample else FeatureBatch(names=[], properties=[], geometries=np.empty(0, dtype=object))
+
+    bbox = None
+    preview = []
+    if len(sample.names):
+        bounds = shapely.total_bounds(sample.geometries)
+        bbox = [round(float(value), 6) for value in bounds]
+        tolerance = max(bounds[2] - bounds[0], bounds[3] - bounds[1]) * PREVIEW_TOLERANCE_RATIO
+        simplified = shapely.simplify(sample.geometries[:preview_features], tolerance, preserve_topology=True)
+        simplified = shapely.set_precision(simplified, tolerance / 10) if tolerance > 0 else simplified
+        preview = [
+            {"type": "Feature", "properties": {"name": name}, "geometry": mapping(geometry)}
+            for name, geometry in zip(sample.names, simplified)
+        ]
+
+    if mode == 'reservoir':
+        estimated_count, count_exact = seen, True
+    else:
+        estimated_count, count_exact = estimate_feature_count(file_like, extension, seen, exhausted)
+
+    return {
+        "mode": mode,
+        "sampled": len(names),
+        "exhausted": exhausted,
+        "estimated_count": estimated_count,
+        "count_exact": count_exact,
+        "source_crs": stage_stats.get('source_crs', crs or TARGET_CRS),
+        "geometry_types": geometry_type_counts(sample.geometries),
+        "bbox": bbox,
+        "properties": property_schema(sample.properties),
+        "validation": dict(validation_report, seconds=round(validation_report['seconds'], 3)),
+        "preview": {"type": "FeatureCollection", "features": preview},
+    }
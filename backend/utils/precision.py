@@ -0,0 +1,43 @@
+import os
+import numpy as np
+import shapely
+
+# Số chữ số thập phân của toạ độ trong GeoJSON trả về: 6 chữ số ~ 0.1 m với WGS84,
+# đủ cho hiển thị và nhỏ hơn nhiều so với double đầy đủ
+DEFAULT_PRECISION = 6
+MAX_PRECISION = 15
+# Làm tròn toạ độ của feature import từ file (bulk_insert_features, set_precision theo lưới 10^-n độ);
+# feature vẽ tay không bị làm tròn. Để trống thì giữ nguyên
+STORAGE_PRECISION = int(os.environ["STORAGE_PRECISION"]) if os.getenv("STORAGE_PRECISION") else None
+
+def round_coordinates(coordinates, precision):
+    if coordinates and isinstance(coordinates[0], (int, float)):
+        return [round(value, precision) for value in coordinates]
+    return [round_coordinates(part, precision) for part in coordinates]
+
+def round_geojson(value, precision):
+    # Làm tròn toạ độ của FeatureCollection/Feature/geometry GeoJSON đã parse (dict)
+    if isinstance(value, list):
+        return [round_geojson(item, precision) for item in value]
+    if not isinstance(value, dict):
+        return value
+    rounded = dict(value)
+    if 'coordinates' in value:
+        rounded['coordinates'] = round_coordinates(value['coordinates'], precision)
+    for key in ('features', 'geometry', 'geometries'):
+        if value.get(key) is not None:
+            rounded[key] = round_geojson(value[key], precision)
+    return rounded
+
+def snap_geometries(geometries, precision=STORAGE_PRECISION):
+    # set_precision giữ geometry hợp lệ; phần bị co lại thành rỗng sẽ bị validate_batches loại
+    if precision is None:
+        return geometries
+    return shapely.set_precision(np.asarray(geometries, dtype=object), 10.0 ** -precision)
+
+def snap_batches(feature_batches, precision=STORAGE_PRECISION):
+    for feature_batch in feature_batches:
+        if precision is None:
+            yield feature_batch
+        else:
+            yield feature_batch._replace(geometries=snap_geometries(feature_batch.geometries, precision))
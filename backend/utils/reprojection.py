@@ -0,0 +1,44 @@
+import time
+import threading
+import shapely
+from pyproj import CRS, Transformer
+
+TARGET_CRS = "EPSG:4326"
+
+# Transformer của pyproj không nên dùng chung giữa các thread, nên cache theo từng thread
+_local = threading.local()
+
+def get_transformer(source_crs, target_crs=TARGET_CRS):
+    cache = getattr(_local, 'transformers', None)
+    if cache is None:
+        cache = _local.transformers = {}
+    key = (source_crs, target_crs)
+    if key not in cache:
+        cache[key] = Transformer.from_crs(source_crs, target_crs, always_xy=True)
+    return cache[key]
+
+def needs_reprojection(source_crs, target_crs=TARGET_CRS):
+    if not source_crs:
+        return False
+    cache = getattr(_local, 'same_crs', None)
+    if cache is None:
+        cache = _local.same_crs = {}
+    key = (source_crs, target_crs)
+    if key not in cache:
+        cache[key] = CRS.from_user_input(source_crs).equals(CRS.from_user_input(target_crs), ignore_axis_order=True)
+    return not cache[key]
+
+def reproject_geometries(geometries, source_crs, target_crs=TARGET_CRS):
+    # Chuyển toàn bộ toạ độ của cả mảng geometry trong một lần gọi pyproj
+    transformer = get_transformer(source_crs, target_crs)
+    return shapely.transform(geometries, transformer.transform, interleaved=False)
+
+def reproject_batches(feature_batches, stats=None, target_crs=TARGET_CRS):
+    for feature_batch in feature_batches:
+        if needs_reprojection(feature_batch.crs, target_crs):
+            started = time.perf_counter()
+            feature_batch = feature_batch._replace(geometries=reproject_geometries(feature_batch.geometries, feature_batch.crs, target_crs))
+            if stats is not None:
+                stats['source_crs'] = feature_batch.crs
+                stats['reproject_seconds'] = stats.get('reproject_seconds', 0) + time.perf_counter() - started
+        yield feature_batch
@@ -0,0 +1,130 @@
+import os
+import threading
+from collections import OrderedDict
+
+# Cache response đã dựng sẵn (bytes) của các layer hay được đọc. Khoá chứa version của
+# layer nên bản cũ không bao giờ được trả về sau khi ghi; việc xoá theo tag khi ghi chỉ
+# để giải phóng bộ nhớ sớm. Khoá và tag là chuỗi để backend dùng chung giữa các worker
+# (Redis, memcached...) có thể thay thế backend trong process bằng set_response_cache.
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", str(256 * 1024 * 1024)))
+# Response lớn hơn phần này của dung lượng thì không cache, tránh đẩy hết các layer khác ra
+RESPONSE_CACHE_MAX_ENTRY_RATIO = 0.25
+
+class ResponseCacheBackend:
+    def get(self, key):
+        raise NotImplementedError
+
+    def set(self, key, value, tag=None):
+        raise NotImplementedError
+
+    def invalidate(self, tag):
+        raise NotImplementedError
+
+    def stats(self):
+        raise NotImplementedError
+
+class MemoryResponseCache(ResponseCacheBackend):
+    # LRU giới hạn theo tổng số byte, dùng chung cho mọi request của một process
+    def __init__(self, max_bytes=RESPONSE_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()
+        self.tags = {}
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def set(self, key, value, tag=None):
+        if len(value) > self.max_bytes * RESPONSE_CACHE_MAX_ENTRY_RATIO:
+            return False
+        with self.lock:
+            self.remove(key)
+            self.entries[key] = (value, tag)
+            self.size += len(value)
+            if tag is not None:
+                self.tags.setdefault(tag, set()).add(key)
+            while self.size > self.max_bytes:
+                self.remove(next(iter(self.entries)))
+                self.evictions += 1
+        return True
+
+    def invalidate(self, tag):
+        with self.lock:
+            keys = self.tags.pop(tag, ())
+            for key in keys:
+                self.remove(key)
+            self.invalidations += len(keys)
+
+    def remove(self, key):
+        # Gọi khi đang giữ lock
+        entry = self.entries.pop(key, None)
+        if entry is None:
+            return
+        value, tag = entry
+        self.size -= len(value)
+        keys = self.tags.get(tag)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self.tags[tag]
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "backend": "memory",
+                "entries": len(self.entries),
+                "bytes": self.size,
+                "max_bytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations,
+            }
+
+response_cache = MemoryResponseCache()
+
+def set_response_cache(backend):
+    global response_cache
+    response_cache = backend
+
+def cache_key(*parts):
+    return ':'.join('' if part is None else str(part) for part in parts)
+
+def layer_tag(layer_id):
+    return f"layer:{layer_id}"
+
+def default_layer_tag(layer_id):
+    return f"default-layer:{layer_id}"
+
+def cached_body(key, tag, build):
+    # Trả về bytes từ cache, hoặc dựng bằng build() rồi lưu lại
+    body = response_cache.get(key)
+    if body is None:
+        body = build()
+        response_cache.set(key, body, tag)
+    return body
+
+def invalidate_layer_responses(layer_ids):
+    for layer_id in set(layer_ids):
+        response_cache.invalidate(layer_tag(layer_id))
+
+def invalidate_default_layer_responses(layer_ids):
+    for layer_id in set(layer_ids):
+        response_cache.invalidate(default_layer_tag(layer_id))
+
+def response_cache_stats():
+    return response_cache.stats()
@@ -0,0 +1,59 @@
+import os
+import time
+import shutil
+import tempfile
+
+# Cache tile trên đĩa: {TILE_CACHE_DIR}/{namespace}/{key}/{generation}/{z}/{x}/{y}.mvt.
+# Mỗi lần dữ liệu thay đổi thì chuyển sang generation mới và xoá thư mục cũ, nên tile
+# đang được ghi dở từ dữ liệu cũ chỉ rơi vào thư mục không còn được đọc nữa.
+TILE_CACHE_DIR = os.getenv("TILE_CACHE_DIR", os.path.join(tempfile.gettempdir(), "gis_tiles"))
+GENERATION_FILE = "generation"
+
+def cache_dir(namespace, key):
+    return os.path.join(TILE_CACHE_DIR, namespace, str(key))
+
+def current_generation(namespace, key):
+    try:
+        with open(os.path.join(cache_dir(namespace, key), GENERATION_FILE)) as generation:
+            return generation.read().strip() or "0"
+    except FileNotFoundError:
+        return "0"
+
+def tile_path(namespace, key, generation, z, x, y):
+    return os.path.join(cache_dir(namespace, key), generation, str(z), str(x), f"{y}.mvt")
+
+def write_atomic(path, data, mode='wb'):
+    # Ghi ra file tạm cùng thư mục rồi đổi tên, người đọc không bao giờ thấy file ghi dở
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(fd, mode) as out:
+            out.write(data)
+        os.replace(tmp_path, path)
+    except BaseException:
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+        raise
+
+def cached_tile(namespace, key, z, x, y, render):
+    # Tile rỗng cũng được lưu (file 0 byte) để không phải hỏi lại database
+    path = tile_path(namespace, key, current_generation(namespace, key), z, x, y)
+    try:
+        with open(path, 'rb') as cached:
+            return cached.read()
+    except FileNotFoundError:
+        pass
+    data = render()
+    write_atomic(path, data)
+    return data
+
+def invalidate_tiles(namespace, key):
+    directory = cache_dir(namespace, key)
+    generation = str(time.time_ns())
+    write_atomic(os.path.join(directory, GENERATION_FILE), generation, mode='w')
+    for entry in os.listdir(directory):
+        if entry not in (generation, GENERATION_FILE) and not entry.endswith('.tmp'):
+            shutil.rmtree(os.path.join(directory, entry), ignore_errors=True)
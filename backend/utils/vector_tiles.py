@@ -0,0 +1,38 @@
+from sqlalchemy import func, select, case, cast, literal_column
+from sqlalchemy.dialects.postgresql import JSONB
+
+# Tham số tile MVT: hệ toạ độ nội bộ 4096 đơn vị mỗi cạnh, đệm 64 đơn vị để nét vẽ không bị cắt ở mép tile
+MVT_EXTENT = 4096
+MVT_BUFFER = 64
+MVT_MEDIA_TYPE = "application/vnd.mapbox-vector-tile"
+MAX_TILE_ZOOM = 24
+
+def valid_tile(z, x, y):
+    return 0 <= z <= MAX_TILE_ZOOM and 0 <= x < 2 ** z and 0 <= y < 2 ** z
+
+def json_properties(column):
+    # properties có thể là object JSONB hoặc chuỗi JSON (dữ liệu import) nằm trong JSONB
+    return case(
+        (func.jsonb_typeof(column) == 'string', cast(column.op('#>>')(literal_column("'{}'")), JSONB)),
+        else_=column
+    )
+
+def mvt_query(geometry, layer_name, id_column, columns, criteria, z, x, y, search_geometry=None, search_filter=None):
+    # Một câu SQL: lọc feature chạm tile (kể cả vùng đệm), cắt và lượng tử hoá geometry
+    # theo lưới của tile bằng ST_AsMVTGeom rồi gói thành tile bằng ST_AsMVT.
+    # search_geometry: cột có index để lọc khi geometry là biểu thức (vd. đã đơn giản hoá);
+    # search_filter(envelope): điều kiện lọc có index tự dựng (vd. geometry_overlaps)
+    envelope = func.ST_TileEnvelope(z, x, y)
+    search_envelope = func.ST_Transform(
+        func.ST_TileEnvelope(z, x, y, literal_column(f"margin => {MVT_BUFFER / MVT_EXTENT}")), 4326
+    )
+    tile_geometry = func.ST_AsMVTGeom(func.ST_Transform(geometry, 3857), envelope, MVT_EXTENT, MVT_BUFFER, True)
+    rows = select(
+        tile_geometry.label('geom'),
+        id_column.label('id'),
+        *columns
+    ).where(*criteria, search_filter(search_envelope) if search_filter is not None
+            else (geometry if search_geometry is None else search_geometry).op('&&')(search_envelope)).subquery('tile')
+    return select(
+        func.ST_AsMVT(literal_column('tile'), layer_name, MVT_EXTENT, 'geom', 'id')
+    ).select_from(rows).where(rows.c.geom.isnot(None))
@@ -0,0 +1,66 @@
+import hashlib
+import json
+from fastapi import Response, status
+from sqlalchemy import select
+from model.layers import Layer
+from model.projects import Project
+from model.default_vector_layer import DefaultVectorLayer
+from utils.response_cache import invalidate_layer_responses, invalidate_default_layer_responses
+
+# Version của Layer/DefaultVectorLayer/Project được tăng trong cùng transaction với thay đổi,
+# nên endpoint đọc chỉ cần so version (không đọc feature) để trả 304 Not Modified
+
+def present_ids(ids):
+    return list({value for value in ids if value is not None})
+
+def bump_project_versions(db, project_ids):
+    project_ids = present_ids(project_ids)
+    if project_ids:
+        db.query(Project).filter(Project.project_id.in_(project_ids)).update(
+            {Project.version: Project.version + 1}, synchronize_session=False
+        )
+
+def bump_layer_versions(db, layer_ids):
+    # Layer thay đổi thì project chứa nó cũng đổi version (danh sách layer của project)
+    layer_ids = present_ids(layer_ids)
+    if not layer_ids:
+        return
+    db.query(Layer).filter(Layer.layer_id.in_(layer_ids)).update(
+        {Layer.version: Layer.version + 1}, synchronize_session=False
+    )
+    # Response cache theo version cũ không còn được đọc tới, xoá luôn để trả lại bộ nhớ
+    invalidate_layer_responses(layer_ids)
+    project_ids = select(Layer.project_id).where(Layer.layer_id.in_(layer_ids))
+    db.query(Project).filter(Project.project_id.in_(project_ids)).update(
+        {Project.version: Project.version + 1}, synchronize_session=False
+    )
+
+def bump_default_layer_versions(db, layer_ids):
+    layer_ids = present_ids(layer_ids)
+    if layer_ids:
+        db.query(DefaultVectorLayer).filter(DefaultVectorLayer.default_layer_id.in_(layer_ids)).update(
+            {DefaultVectorLayer.version: DefaultVectorLayer.version + 1}, synchronize_session=False
+        )
+        invalidate_default_layer_responses(layer_ids)
+
+def make_etag(*parts):
+    # ETag mạnh từ version và mọi tham số ảnh hưởng tới nội dung response
+    digest = hashlib.blake2b(json.dumps(parts, default=str, separators=(',', ':')).encode(), digest_size=16)
+    return f'"{digest.hexdigest()}"'
+
+def etag_matches(if_none_match, etag):
+    # If-None-Match so sánh yếu: bỏ tiền tố W/
+    if not if_none_match:
+        return False
+    candidates = [value.strip() for value in if_none_match.split(',')]
+    return '*' in candidates or etag in [value[2:] if value.startswith('W/') else value for value in candidates]
+
+def etag_headers(etag, private=True, vary=None):
+    # no-cache: trình duyệt vẫn lưu response nhưng luôn hỏi lại server bằng If-None-Match
+    headers = {"ETag": etag, "Cache-Control": "private, no-cache" if private else "no-cache"}
+    if vary:
+        headers["Vary"] = vary
+    return headers
+
+def not_modified(headers):
+    return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)